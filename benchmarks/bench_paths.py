@@ -0,0 +1,48 @@
+"""Compare per-segment path building against programation.paths
+
+Usage:
+> python benchmarks/bench_paths.py [<anchors> ...]
+"""
+import os
+import sys
+import timeit
+
+import numpy
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+import programation.paths as paths  # noqa: E402
+
+DEF_SIZES = [100, 10000, 100000]
+
+
+def legacy_path(points):
+    """Path building as previously done in VShape.draw_self"""
+    path = "M {} {}".format(*points[0, 0:2])
+    num_triplets = int((len(points) - 1) / 3)
+    triplets = points[1:].reshape(num_triplets, 3, points.shape[1])
+    for triplet in triplets:
+        path += " C {} {} {} {} {} {}".format(*triplet[:, 0:2].flatten())
+    return path
+
+
+def best_time(func, number, repeat):
+    return min(timeit.repeat(func, number=number, repeat=repeat)) / number
+
+
+def run(sizes):
+    print("{:>8} {:>12} {:>12} {:>9}".format("anchors", "legacy (s)",
+                                            "paths (s)", "speed-up"))
+    for size in sizes:
+        points = numpy.random.rand(3 * (size - 1) + 1, 2) * 1000
+        number = max(1, 10000 // size)
+        # The legacy version is quadratic, only time it once for big paths
+        repeat = 3 if size <= 10000 else 1
+        legacy = best_time(lambda: legacy_path(points), number, repeat)
+        vectorized = best_time(lambda: paths.bezier_path(points), number, 3)
+        print("{:>8} {:>12.6f} {:>12.6f} {:>8.1f}x".format(
+            size, legacy, vectorized, legacy / vectorized))
+
+
+if __name__ == "__main__":
+    run([int(arg) for arg in sys.argv[1:]] or DEF_SIZES)
@@ -0,0 +1,355 @@
+"""End-to-end rendering benchmark of the main.py scene and stress scenes
+
+Reports the time per frame spent in each stage:
+update -- Posing the scene (scene(i))
+paths -- Building path strings and aggdraw symbols
+camera -- Frame bookkeeping (fingerprints, static layer)
+rasterize -- aggdraw drawing (Canvas.draw, without paths and convert)
+convert -- Copying the drawing into a frame array
+encode -- FFmpeg encoding, skipped if FFmpeg isn't available
+
+Each case is run several times, keeping the best time of each stage.
+Results are written as JSON and compared against a baseline, stages slower
+than the baseline by more than the threshold are flagged as regressions.
+
+Usage:
+> python benchmarks/bench_render.py [-scenes main,lines,...]
+      [-sizes 360,720,1080] [-frames <n>] [-output <json>]
+      [-baseline <json>] [-save-baseline] [-threshold <fraction>]
+      [-repeat <n>] [-no-encode]
+"""
+import collections
+import json
+import os
+import platform
+import shutil
+import sys
+import tempfile
+import time
+
+import numpy
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+import main  # noqa: E402
+import programation.camera as camera  # noqa: E402
+import programation.canvas as canvas  # noqa: E402
+import programation.helpers as helpers  # noqa: E402
+import programation.paths as paths  # noqa: E402
+import programation.shape as shape  # noqa: E402
+import programation.shapes as shapes  # noqa: E402
+import programation.stream as stream  # noqa: E402
+import programation.transform as transform  # noqa: E402
+import programation.vshapes as vshapes  # noqa: E402
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+DEF_OUTPUT = os.path.join(BENCH_DIR, "results.json")
+DEF_BASELINE = os.path.join(BENCH_DIR, "baseline.json")
+SIZES = {360: (640, 360), 720: (1280, 720), 1080: (1920, 1080)}
+STAGES = ["update", "paths", "camera", "rasterize", "convert", "encode"]
+# Stages faster than this (ms per frame) are too noisy to flag
+MIN_STAGE_TIME = .5
+
+
+class LinesScene(object):
+    """Many Lines spinning together"""
+
+    def __init__(self, width, height, count=10000):
+        rng = numpy.random.RandomState(0)
+        self.width, self.height = width, height
+        self.root = shape.Shape()
+        for _ in range(count):
+            p0, p1 = rng.rand(2, 2) * [width, height]
+            # Lines need a box with non-zero size
+            if (p0 == p1).any():
+                p1 = p1 + 1.
+            self.root.add(shapes.Line(tuple(p0), tuple(p1),
+                                      stroke_color="aqua"))
+
+    def __call__(self, i):
+        self.root.transform_.assign(transform.Transform.ROTATE_ABOUT(
+            self.width / 2, self.height / 2, 3. * i))
+        return self.root,
+
+
+class PolylineScene(object):
+    """Long smooth Polylines changing shape"""
+
+    def __init__(self, width, height, count=10, length=2000):
+        self.x = numpy.linspace(0., width, length)
+        self.height = height
+        self.lines = [shapes.Polyline(
+            *numpy.stack([self.x, numpy.full(length, height / 2.)], 1),
+            smooth=True, stroke_color="white") for _ in range(count)]
+
+    def __call__(self, i):
+        for j, line in enumerate(self.lines):
+            line.points[:, 1] = self.height * (
+                .5 + .4 * numpy.sin(self.x * (.01 + .002 * j) + .3 * i))
+            line.update_symbol()
+        return tuple(self.lines)
+
+
+class TreeScene(object):
+    """A deep chain of Shapes, each with a small transform"""
+
+    def __init__(self, width, height, depth=200):
+        self.width, self.height = width, height
+        self.root = parent = shapes.Line((0., 0.), (width / 50., 1.),
+                                         stroke_color="red")
+        for _ in range(depth - 1):
+            child = shapes.Line(
+                (0., 0.), (width / 50., 1.), stroke_color="red",
+                transform_=transform.Transform.ROTATE(5.).shift(
+                    width / 100., 0.))
+            parent.add(child)
+            parent = child
+
+    def __call__(self, i):
+        self.root.transform_.assign(transform.Transform.SHIFT(
+            self.width / 2, self.height / 2).rotate_about(
+            self.width / 2, self.height / 2, 2. * i))
+        return self.root,
+
+
+class VShapeScene(object):
+    """Heavily subdivided VShapes with a nonlinear transform"""
+
+    def __init__(self, width, height, count=20, subdivisions=64):
+        self.width, self.height = width, height
+        self.count, self.subdivisions = count, subdivisions
+        self.rects = [vshapes.Rectangle(width=width / 8, height=height / 8,
+                                        fill_color="white")
+                      for _ in range(count)]
+
+    def __call__(self, i):
+        for j, rect in enumerate(self.rects):
+            rect.create_points().shift(
+                ((j % 5) * self.width / 5, (j // 5) * self.height / 4))\
+                .subdivide(self.subdivisions)\
+                .transform_nonlinear(helpers.wave_func, [i / 30. + j / 7.],
+                                     expanded=True)
+        return tuple(self.rects)
+
+
+SCENES = collections.OrderedDict([
+    ("main", main.TestScene),
+    ("lines", LinesScene),
+    ("polyline", PolylineScene),
+    ("tree", TreeScene),
+    ("vshape", VShapeScene),
+])
+
+
+class StageTimer(object):
+    """Accumulates exclusive time per stage, nested stages are subtracted
+    from the enclosing one"""
+
+    def __init__(self):
+        self.totals = collections.defaultdict(float)
+        self.stack = []
+
+    def wrap(self, name, func):
+        def timed(*args, **kwargs):
+            self.stack.append(0.)
+            start = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                elapsed = time.perf_counter() - start
+                nested = self.stack.pop()
+                self.totals[name] += elapsed - nested
+                if self.stack:
+                    self.stack[-1] += elapsed
+        return timed
+
+
+def instrument(timer):
+    """Time the stages by wrapping the functions that implement them,
+    returns a function undoing it"""
+    targets = [
+        (paths, "bezier_path", "paths"),
+        (paths, "make_symbol", "paths"),
+        (camera.Camera, "render", "camera"),
+        (canvas.Canvas, "draw", "rasterize"),
+        (canvas.Canvas, "read_frame", "convert"),
+    ]
+    originals = [(owner, attr, getattr(owner, attr))
+                 for owner, attr, _ in targets]
+    for owner, attr, name in targets:
+        setattr(owner, attr, timer.wrap(name, getattr(owner, attr)))
+
+    def restore():
+        for owner, attr, original in originals:
+            setattr(owner, attr, original)
+    return restore
+
+
+def run_case(scene_cls, size, frames, encode):
+    """Render and encode one scene at one size, returns the result dict"""
+    w, h = SIZES[size]
+    scene = scene_cls(w, h)
+    if frames is None:
+        frames = len(scene) if hasattr(scene, "__len__") else 10
+    timer = StageTimer()
+    update = timer.wrap("update", scene)
+    cam = camera.Camera(width=w, height=h)
+    restore = instrument(timer)
+    start = time.perf_counter()
+    try:
+        for i in range(frames):
+            cam.capture_frame(*update(i))
+    finally:
+        restore()
+    render_time = time.perf_counter() - start
+    if encode:
+        timer.totals["encode"] = encode_frames(cam.frames, w, h)
+    result = {
+        "frames": frames,
+        "width": w,
+        "height": h,
+        "render_fps": frames / render_time,
+        "stages": {stage: timer.totals[stage] / frames * 1000.
+                   for stage in STAGES if stage in timer.totals},
+    }
+    result["total"] = sum(result["stages"].values())
+    return result
+
+
+def best_case(scene_cls, size, frames, encode, repeat):
+    """Run a case several times, keeping the best time of each stage"""
+    runs = [run_case(scene_cls, size, frames, encode) for _ in range(repeat)]
+    best = max(runs, key=lambda result: result["render_fps"])
+    best["stages"] = {stage: min(result["stages"][stage] for result in runs)
+                      for stage in best["stages"]}
+    best["total"] = min(result["total"] for result in runs)
+    return best
+
+
+def encode_frames(frames, width, height):
+    """Encode frames to a temporary mp4, returns the elapsed time"""
+    tempdir = tempfile.mkdtemp()
+    try:
+        start = time.perf_counter()
+        video = stream.VideoStream(os.path.join(tempdir, "bench.mp4"), width,
+                                   height, verbose=False)
+        for frame in frames:
+            video.write(frame)
+        video.close()
+        return time.perf_counter() - start
+    finally:
+        shutil.rmtree(tempdir)
+
+
+def compare(results, baseline, threshold):
+    """List the stages slower than the baseline by more than threshold"""
+    regressions = []
+    for case, result in results.items():
+        if case not in baseline:
+            continue
+        old = dict(baseline[case]["stages"], total=baseline[case]["total"])
+        new = dict(result["stages"], total=result["total"])
+        for stage, value in new.items():
+            if stage in old and old[stage] > MIN_STAGE_TIME and \
+                    value > old[stage] * (1. + threshold):
+                regressions.append((case, stage, old[stage], value))
+    return regressions
+
+
+def print_table(results, baseline):
+    print("{:<16}".format("case") +
+          "".join("{:>10}".format(s) for s in STAGES + ["total"]) +
+          "{:>10}".format("vs base"))
+    for case, result in results.items():
+        stages = result["stages"]
+        row = "{:<16}".format(case) + "".join(
+            "{:>10.2f}".format(stages[s]) if s in stages else "{:>10}"
+            .format("-") for s in STAGES)
+        row += "{:>10.2f}".format(result["total"])
+        if case in baseline:
+            row += "{:>+9.1f}%".format(
+                100. * (result["total"] / baseline[case]["total"] - 1.))
+        print(row)
+    print("(ms per frame)")
+
+
+def parse_args(argv):
+    args = dict(scenes=list(SCENES), sizes=sorted(SIZES), frames=None,
+                output=DEF_OUTPUT, baseline=DEF_BASELINE, save=False,
+                threshold=.2, repeat=3, encode=True)
+    i = 0
+    while i < len(argv):
+        arg = argv[i]
+        value = argv[i + 1] if i + 1 < len(argv) else None
+        if arg == "-scenes":
+            args["scenes"] = value.split(",")
+            i += 1
+        elif arg == "-sizes":
+            args["sizes"] = [int(size) for size in value.split(",")]
+            i += 1
+        elif arg == "-frames":
+            args["frames"] = int(value)
+            i += 1
+        elif arg == "-output":
+            args["output"] = value
+            i += 1
+        elif arg == "-baseline":
+            args["baseline"] = value
+            i += 1
+        elif arg == "-threshold":
+            args["threshold"] = float(value)
+            i += 1
+        elif arg == "-repeat":
+            args["repeat"] = int(value)
+            i += 1
+        elif arg == "-save-baseline":
+            args["save"] = True
+        elif arg == "-no-encode":
+            args["encode"] = False
+        else:
+            raise ValueError(f"Unknown parameter: {arg}")
+        i += 1
+    for scene in args["scenes"]:
+        assert scene in SCENES, "Unknown scene: " + scene
+    for size in args["sizes"]:
+        assert size in SIZES, "Unknown size: {}".format(size)
+    return args
+
+
+def run(argv):
+    args = parse_args(argv)
+    encode = args["encode"] and shutil.which(helpers.FFMPEG_BIN) is not None
+    if args["encode"] and not encode:
+        print("FFmpeg not found, skipping encoding")
+    results = collections.OrderedDict()
+    for name in args["scenes"]:
+        for size in args["sizes"]:
+            case = "{}@{}p".format(name, size)
+            print(f"Running {case}")
+            results[case] = best_case(SCENES[name], size, args["frames"],
+                                      encode, args["repeat"])
+    baseline = {}
+    if os.path.exists(args["baseline"]) and not args["save"]:
+        with open(args["baseline"]) as f:
+            baseline = json.load(f)["results"]
+    print_table(results, baseline)
+    report = {
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "cpus": os.cpu_count(),
+        "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "results": results,
+    }
+    path = args["baseline"] if args["save"] else args["output"]
+    with open(path, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"Saved results to '{path}'")
+    regressions = compare(results, baseline, args["threshold"])
+    for case, stage, old, new in regressions:
+        print("REGRESSION {} {}: {:.2f} -> {:.2f} ms/frame ({:+.0f}%)".format(
+            case, stage, old, new, 100. * (new / old - 1.)))
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(run(sys.argv[1:]))
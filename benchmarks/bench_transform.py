@@ -0,0 +1,88 @@
+"""Compare per-operation cost of the 3x3 NumPy Transform against the
+__slots__ based programation.transform.Transform
+
+Usage:
+> python benchmarks/bench_transform.py
+"""
+from copy import deepcopy
+import os
+import sys
+import timeit
+
+import numpy
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+import programation.helpers as helpers  # noqa: E402
+import programation.transform as transform  # noqa: E402
+
+NUMBER = 20000
+
+
+class LegacyTransform(object):
+    """The previous Transform implementation, reduced to the benchmarked
+    operations"""
+
+    def __init__(self, a, b, c, d, e, f):
+        for v in [a, b, c, d, e, f]:
+            assert helpers.is_number(v), "Parameters must be numbers"
+        self.matrix = numpy.array([[a, b, c], [d, e, f], [0., 0., 1.]])
+
+    def copy(self):
+        return deepcopy(self)
+
+    def apply(self, x, y):
+        point = self.matrix.dot(numpy.array([[x], [y], [1]]))
+        return (point[0], point[1])
+
+    def merge(self, other):
+        self.matrix = other.matrix.dot(self.matrix)
+        return self
+
+    def inverse(self):
+        return LegacyTransform(*numpy.linalg.inv(self.matrix).flatten()[0:6])
+
+    @staticmethod
+    def SKEW_ABOUT(xcenter, ycenter, a, b, c, d):
+        offset = numpy.array([[0], [0]])
+        if xcenter != 0. or ycenter != 0.:
+            center = numpy.array([[xcenter], [ycenter]])
+            offset = (numpy.identity(2, dtype=float)
+                      - numpy.array([[a, b], [c, d]])).dot(center)
+        return LegacyTransform(a, b, offset[0, 0], c, d, offset[1, 0])
+
+    @staticmethod
+    def ROTATE_ABOUT(xcenter, ycenter, angle):
+        return LegacyTransform.SKEW_ABOUT(
+            xcenter, ycenter, *helpers.rotation_matrix(angle).flatten())
+
+
+def operations(cls):
+    t = cls.ROTATE_ABOUT(10., 20., 30.)
+    other = cls.ROTATE_ABOUT(5., 5., 45.)
+    return [
+        ("construct", lambda: cls(1., 0., 2., 0., 1., 3.)),
+        ("copy", t.copy),
+        ("merge", lambda: t.merge(other)),
+        ("invert", t.inverse),
+        ("rotate_about", lambda: cls.ROTATE_ABOUT(10., 20., 30.)),
+        ("apply", lambda: t.apply(1., 2.)),
+    ]
+
+
+def per_op(func):
+    return min(timeit.repeat(func, number=NUMBER, repeat=3)) / NUMBER
+
+
+def run():
+    print("{:>14} {:>12} {:>12} {:>9}".format("operation", "legacy (us)",
+                                              "slots (us)", "speed-up"))
+    for (name, legacy), (_, current) in zip(
+            operations(LegacyTransform), operations(transform.Transform)):
+        before, after = per_op(legacy) * 1e6, per_op(current) * 1e6
+        print("{:>14} {:>12.3f} {:>12.3f} {:>8.1f}x".format(
+            name, before, after, before / after))
+
+
+if __name__ == "__main__":
+    run()
@@ -4,39 +4,60 @@ from colour import Color
 
 import programation.camera as camera
 import programation.helpers as helpers
+import programation.profiler as profiler
 import programation.shapes as shapes
+import programation.stream as stream
 import programation.transform as transform
 import programation.vshapes as vshapes
 
 
-def main(render_width=helpers.DEF_WIDTH, render_height=helpers.DEF_HEIGHT,
-         render_preview=False, render_file=False,
-         render_filename="./files/output/test.mp4"):
-    # Size
-    w, h = render_width, render_height
+class TestScene(object):
+    """Poses the test shapes for a given frame
 
-    # Tests
-    c = camera.Camera(width=w, height=h, loop_behavior="reverse")
-    t = transform.Transform.IDENTITY().shift(w / 8, h / 8).rotate_about(
-        w / 2, h / 2, 180)
-    pt = transform.Transform.RESIZE_ABOUT(w / 2, h / 2, 1., .5)
-    s = shapes.TestShapeChildren(width=w, height=h, stroke_color="red",
-                                 stroke_width=2., fill_color=Color("green"),
-                                 transform=t, parent_transform=pt)
-    b1 = shapes.BezierCurve((0, 0), (0, h), (w, h), (w, 0),
-                            stroke_color="#FF00FF", stroke_width=8.)
-    b2 = shapes.BezierCurve((0, 0), (0, h), (w, h), (w, 0),
-                            stroke_color="aqua", stroke_width=5.,
-                            slice_pos=.5, close_path=True)
-    b3 = shapes.BezierCurve((0, 0), (0, h), (w, h), (w, 0),
-                            stroke_color=(1., 0., 0.), stroke_width=2.,
-                            slice_pos=.25)
-    s.add(b1, b2, b3)
-    p = shapes.Polyline((w / 4, h / 4), (w / 2, 3 * h / 4), (3 * w / 4, h / 4),
-                        (w / 4, h / 4), smooth=True, stroke_color="white")
-    rect = vshapes.Rectangle(width=w / 4, height=h / 4, fill_color="white")
-    parts = 30
-    for i in range(0, parts + 1):
+    Only the size is pickled, so worker processes build their own shapes
+    """
+
+    def __init__(self, width, height, parts=30):
+        self.width, self.height, self.parts = width, height, parts
+        self.shapes = None
+
+    def __getstate__(self):
+        return dict(width=self.width, height=self.height, parts=self.parts,
+                    shapes=None)
+
+    def __len__(self):
+        return self.parts + 1
+
+    def create_shapes(self):
+        w, h = self.width, self.height
+        t = transform.Transform.IDENTITY().shift(w / 8, h / 8).rotate_about(
+            w / 2, h / 2, 180)
+        pt = transform.Transform.RESIZE_ABOUT(w / 2, h / 2, 1., .5)
+        s = shapes.TestShapeChildren(width=w, height=h, stroke_color="red",
+                                     stroke_width=2., fill_color=Color("green"),
+                                     transform=t, parent_transform=pt)
+        b1 = shapes.BezierCurve((0, 0), (0, h), (w, h), (w, 0),
+                                stroke_color="#FF00FF", stroke_width=8.)
+        b2 = shapes.BezierCurve((0, 0), (0, h), (w, h), (w, 0),
+                                stroke_color="aqua", stroke_width=5.,
+                                slice_pos=.5, close_path=True)
+        b3 = shapes.BezierCurve((0, 0), (0, h), (w, h), (w, 0),
+                                stroke_color=(1., 0., 0.), stroke_width=2.,
+                                slice_pos=.25)
+        s.add(b1, b2, b3)
+        p = shapes.Polyline((w / 4, h / 4), (w / 2, 3 * h / 4),
+                            (3 * w / 4, h / 4), (w / 4, h / 4), smooth=True,
+                            stroke_color="white")
+        rect = vshapes.Rectangle(width=w / 4, height=h / 4,
+                                 fill_color="white")
+        self.shapes = (s, b2, p, rect)
+
+    def __call__(self, i):
+        """Return the shapes to draw for frame i"""
+        if self.shapes is None:
+            self.create_shapes()
+        w, h, parts = self.width, self.height, self.parts
+        s, b2, p, rect = self.shapes
         f = 1. * i / parts
         f2 = 1. * (i + 1) / (parts + 1)
         b2.slice(1. * f)
@@ -48,21 +69,71 @@ def main(render_width=helpers.DEF_WIDTH, render_height=helpers.DEF_HEIGHT,
         rect.create_points().shift((w / 8, h / 8)).subdivide(8)\
             .transform_nonlinear(helpers.wave_func, [f], expanded=True)\
             .scale(.5)
-        c.capture_frame(s, p, rect)
-    if render_file:
-        c.write_to_file(render_filename, show_loop=True)
+        return s, p, rect
+
+
+def log_stream(render_file, render_filename):
+    """Where to print messages, keeping standard output clean if the video
+    is written to it"""
+    if render_file and render_filename == stream.STDOUT:
+        return sys.stderr
+    return sys.stdout
+
+
+def main(render_width=helpers.DEF_WIDTH, render_height=helpers.DEF_HEIGHT,
+         render_preview=False, render_file=False,
+         render_filename="./files/output/test.mp4", render_workers=1,
+         render_store=None, render_quality="final", render_segments=1,
+         render_profile=None, render_cache=None):
+    # Size
+    w, h = render_width, render_height
+    log = log_stream(render_file, render_filename)
+    if render_profile is not None:
+        profiler.start()
+
+    # Tests
+    c = camera.Camera(width=w, height=h, loop_behavior="reverse",
+                      frame_store="memory" if render_store is None
+                      else "memmap", frame_store_path=render_store,
+                      frame_cache=render_cache)
+    scene = TestScene(w, h)
+    # Segments are encoded once every frame is captured
+    segmented = render_file and render_segments > 1
+    if render_file and not segmented:
+        # Keep every frame only if they're needed for the preview
+        c.start_stream(render_filename, show_loop=True,
+                       window=None if render_preview else 1,
+                       quality=render_quality)
     if render_preview:
-        c.show()
+        # Show frames as they are captured
+        c.capture_live(scene, len(scene), workers=render_workers)
+    else:
+        c.capture_frames(scene, len(scene), workers=render_workers)
+    print(c.render_summary(), file=log)
+    if segmented:
+        c.write_to_file(render_filename, show_loop=True,
+                        quality=render_quality, segments=render_segments)
+    elif render_file:
+        c.stop_stream()
+    c.close()
+    if render_profile is not None:
+        # Shapes drawn by worker processes (-j) aren't profiled
+        profile = profiler.stop()
+        print(profile.summary(), file=log)
+        profile.save_trace(render_profile)
+        print(f"Saved trace to '{render_profile}'", file=log)
 
 
 def run_main():
-    # Parse arguments
+    # Parse arguments, messages are printed once the output is known
     args = {}
+    messages = []
     i = 1
     while i < len(sys.argv):
         arg = sys.argv[i]
         nextArg = None
-        if i + 1 < len(sys.argv) and not sys.argv[i + 1].startswith("-"):
+        if i + 1 < len(sys.argv) and (not sys.argv[i + 1].startswith("-") or
+                                      sys.argv[i + 1] == stream.STDOUT):
             nextArg = sys.argv[i + 1]
         if arg == "-p":
             args["render_preview"] = True
@@ -71,33 +142,72 @@ def run_main():
             if nextArg is not None:
                 i += 1
                 args["render_filename"] = nextArg
+        elif arg == "-c":
+            args["render_cache"] = "./files/cache"
+            if nextArg is not None:
+                i += 1
+                args["render_cache"] = nextArg
+        elif arg == "-profile":
+            args["render_profile"] = "./files/output/trace.json"
+            if nextArg is not None:
+                i += 1
+                args["render_profile"] = nextArg
+        elif arg == "-q":
+            if nextArg is None:
+                print("Must provide a quality", file=sys.stderr)
+                return
+            i += 1
+            args["render_quality"] = nextArg
+        elif arg == "-e":
+            if nextArg is None:
+                print("Must provide a number of segments", file=sys.stderr)
+                return
+            i += 1
+            args["render_segments"] = int(nextArg)
+        elif arg == "-s":
+            if nextArg is None:
+                print("Must provide a store path", file=sys.stderr)
+                return
+            i += 1
+            args["render_store"] = nextArg
+        elif arg == "-j":
+            if nextArg is None:
+                args["render_workers"] = None
+            else:
+                i += 1
+                args["render_workers"] = int(nextArg)
         elif arg == "-size":
             if nextArg is None:
-                print("Must provide a size")
+                print("Must provide a size", file=sys.stderr)
                 return
             i += 1
             if "x" in nextArg:
-                size = map(int, nextArg.split("x"))[:2]
+                size = list(map(int, nextArg.split("x")))[:2]
             else:
                 height = int(nextArg)
                 size = [int(height * 16 / 9), height]
-            print(f"Setting size to {size[0]} by {size[1]}")
+            messages.append(f"Setting size to {size[0]} by {size[1]}")
             args["render_width"] = size[0]
             args["render_height"] = size[1]
         elif arg == "-h":
             args["render_width"] = 1920
             args["render_height"] = 1080
-            print("Setting size to 1080p")
+            messages.append("Setting size to 1080p")
         elif arg == "-m":
             args["render_width"] = 1280
             args["render_height"] = 720
-            print("Setting size to 720p")
+            messages.append("Setting size to 720p")
         else:
-            print(f"Unknown parameter: {arg}")
+            print(f"Unknown parameter: {arg}", file=sys.stderr)
             return
         i += 1
-    if not args:
+    if not args.keys() - {"render_workers", "render_store",
+                          "render_profile", "render_cache"}:
         args["render_preview"] = True
+    log = log_stream(args.get("render_file", False),
+                     args.get("render_filename"))
+    for message in messages:
+        print(message, file=log)
     main(**args)
 
 
@@ -0,0 +1,123 @@
+import collections
+import hashlib
+import os
+import tempfile
+
+import numpy
+
+import programation.helpers as helpers
+
+# Changed whenever the same shapes could be drawn differently, so frames
+# from older versions aren't reused
+CACHE_VERSION = 1
+EXTENSION = ".rgba"
+
+
+def frame_key(objects, width, height):
+    """Hash everything that affects a frame, stable across runs
+
+    objects -- List of Shape objects, with resolved transforms
+
+    Returns: The key, or None if the frame can't be cached
+    """
+    digest = hashlib.sha1()
+    digest.update(repr((CACHE_VERSION, width, height, len(objects)))
+                  .encode())
+    if not all(object_.content_hash(digest) for object_ in objects):
+        return None
+    return digest.hexdigest()
+
+
+class FrameCache(object):
+    """Rendered frames stored on disk by the hash of their content
+
+    Each frame is a raw RGBA file named after its key. When the files take
+    more than max_size bytes, the least recently used ones are deleted.
+    Files can be shared by several processes.
+    """
+
+    CONFIG = {
+        "max_size": 2 ** 30  # Bytes
+    }
+
+    def __init__(self, directory, width, height, **kwargs):
+        helpers.handle_config(self, kwargs, dict(directory=directory,
+                                                 width=width, height=height))
+        if not os.path.isdir(self.directory):
+            os.makedirs(self.directory)
+        self.hits = self.misses = 0
+        self.scan()
+
+    def scan(self):
+        """Index the existing files, oldest first, picking up the files
+        written by other processes"""
+        # {key: size} from least to most recently used
+        self.files = collections.OrderedDict()
+        self.size = 0
+        entries = []
+        for name in os.listdir(self.directory):
+            if not name.endswith(EXTENSION):
+                continue
+            try:
+                info = os.stat(os.path.join(self.directory, name))
+            except OSError:
+                continue
+            entries.append((info.st_mtime, name[:-len(EXTENSION)],
+                            info.st_size))
+        for _, key, size in sorted(entries):
+            self.files[key] = size
+            self.size += size
+
+    def path(self, key):
+        return os.path.join(self.directory, key + EXTENSION)
+
+    def frame_size(self):
+        return self.width * self.height * 4
+
+    def get(self, key):
+        """Get a cached frame, or None if missing"""
+        try:
+            with open(self.path(key), "rb") as f:
+                data = f.read()
+        except OSError:
+            data = None
+        if data is None or len(data) != self.frame_size():
+            self.misses += 1
+            return None
+        self.hits += 1
+        # Mark as recently used, also for other processes
+        try:
+            os.utime(self.path(key))
+        except OSError:
+            pass
+        self.files[key] = len(data)
+        self.files.move_to_end(key)
+        return helpers.frame_from_bytes(data, self.width, self.height)
+
+    def put(self, key, frame):
+        """Store a frame, evicting the least recently used if full"""
+        data = memoryview(numpy.ascontiguousarray(frame, dtype=numpy.uint8))\
+            .cast("B")
+        handle, temp = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+        with os.fdopen(handle, "wb") as f:
+            f.write(data)
+        # Readers never see a partially written file
+        os.replace(temp, self.path(key))
+        self.size += len(data) - self.files.get(key, 0)
+        self.files[key] = len(data)
+        self.files.move_to_end(key)
+        self.evict()
+
+    def evict(self):
+        """Delete the least recently used files until under max_size"""
+        while self.size > self.max_size and self.files:
+            key, size = self.files.popitem(last=False)
+            self.size -= size
+            try:
+                os.remove(self.path(key))
+            except OSError:
+                pass
+
+    def stats(self):
+        """Return (hits, misses, size in bytes)"""
+        return self.hits, self.misses, self.size
@@ -1,13 +1,20 @@
-import math
+import collections
+import concurrent.futures
+import multiprocessing
 import os
-import shutil
-import subprocess
+import sys
+import threading
+import time
 import tkinter
 
 import PIL.ImageTk
 
+import programation.cache as cache
 import programation.canvas as canvas
 import programation.helpers as helpers
+import programation.profiler as profiler
+import programation.store as store
+import programation.stream as stream
 
 
 class Camera(object):
@@ -17,86 +24,385 @@ class Camera(object):
         "width": helpers.DEF_WIDTH,
         "height": helpers.DEF_HEIGHT,
         "frames": [],
+        "frame_store": "memory",  # Possible values: memory, memmap
+        "frame_store_path": None,  # File for memmap frames, None for a temp
         "loop_behavior": "loop",  # Possible values: once, loop, reverse
-        "canvas_config": {}
+        "canvas_config": {},
+        "cache_static": True,  # Reuse the rendered leading static shapes
+        "dedupe_frames": True,  # Reuse the last frame if nothing changed
+        # Directory of rendered frames reused across runs, None for off
+        "frame_cache": None,
+        "frame_cache_size": 2 ** 30  # Bytes kept in the frame cache
     }
 
     def __init__(self, **kwargs):
+        self.stream = None
+        # Number of frames added so far
+        self.captured = 0
+        # (number, frame) of recently captured frames for a live preview,
+        # and whether capturing is finished
+        self.live_frames = self.live_done = None
+        # (fingerprints, frame) of the last static layer and render, and
+        # (bytes, frame) of the last frame from a worker
+        self.static_layer = self.last_render = self.last_received = None
+        self.render_stats = dict(rendered=0, reused=0, bytes_saved=0,
+                                 cache_hits=0, cache_misses=0)
+        # Whether the last render reused the previous frame, and whether it
+        # came from the frame cache (None if not looked up)
+        self.last_reused = False
+        self.last_cache_hit = None
+
         helpers.handle_config(self, kwargs)
+        assert self.frame_store in ("memory", "memmap"), \
+            "Unknown frame store: {}".format(self.frame_store)
+        if self.frame_store == "memmap" and not isinstance(
+                self.frames, store.FrameStore):
+            frames = self.frames
+            self.frames = store.FrameStore(self.frame_store_path, self.width,
+                                           self.height)
+            for frame in frames:
+                self.frames.append(frame)
         self.canvas = canvas.Canvas(**helpers.change_kwargs(
             self.canvas_config, width=self.width, height=self.height))
+        self.cache = None
+        if self.frame_cache is not None:
+            self.cache = cache.FrameCache(self.frame_cache, self.width,
+                                          self.height,
+                                          max_size=self.frame_cache_size)
+
+    @staticmethod
+    def from_store(path, **kwargs):
+        """Create a camera with the frames of an existing memmap store"""
+        frames = store.FrameStore.open(path)
+        return Camera(**helpers.change_kwargs(
+            kwargs, frames=frames, frame_store="memmap", width=frames.width,
+            height=frames.height))
+
+    def close(self):
+        """Close the frame store, deleting a temporary memmap store"""
+        if isinstance(self.frames, store.FrameStore):
+            self.frames.close()
+
+    def log(self, message):
+        """Print a message, keeping standard output clean if the stream
+        writes to it"""
+        if self.stream is not None and self.stream.filename == stream.STDOUT:
+            print(message, file=sys.stderr)
+        else:
+            print(message)
 
     def capture_frame(self, *objects, **kwargs):
         """Create a new frame
 
         objects -- List of Shape objects to draw
         """
+        with profiler.span("frame", "camera", frame=self.captured):
+            self.add_frame(self.render(*objects, **kwargs))
+
+    def render(self, *objects, **kwargs):
+        """Draw a frame and return its data
+
+        Shapes marked static at the start of objects are drawn once into a
+        cached layer, later frames start from a copy of it. The layer is
+        redrawn whenever the fingerprint of those shapes changes.
+
+        If nothing changed since the last frame, the same frame object is
+        returned without drawing. Otherwise, if there is a frame cache, the
+        frame is looked up by the hash of its content before drawing.
+
+        objects -- List of Shape objects to draw
+        """
+        fingerprints = None
+        self.last_reused = False
+        self.last_cache_hit = None
+        if self.dedupe_frames and "background" not in kwargs:
+            with profiler.span("fingerprint", "camera"):
+                for object_ in objects:
+                    object_.resolve_transforms()
+                fingerprints = [object_.fingerprint() for object_ in objects]
+            if (self.last_render is not None and
+                    self.last_render[0] == fingerprints):
+                self.last_reused = True
+                return self.reuse_frame(self.last_render[1])
+        key = None
+        if self.cache is not None and "background" not in kwargs:
+            with profiler.span("frame_cache", "camera"):
+                for object_ in objects:
+                    object_.resolve_transforms()
+                key = cache.frame_key(objects, self.width, self.height)
+                data = None if key is None else self.cache.get(key)
+            if key is not None:
+                self.count_cache_hit(data is not None)
+            if data is not None:
+                self.last_render = (fingerprints, data)
+                return data
+        count = 0
+        while count < len(objects) and objects[count].static:
+            count += 1
+        if count and self.cache_static and "background" not in kwargs:
+            with profiler.span("static_layer", "camera"):
+                kwargs["background"] = self.get_static_layer(objects[:count])
+            objects = objects[count:]
         self.canvas.draw(*objects, **kwargs)
-        self.frames.append(self.canvas.data)
+        self.render_stats["rendered"] += 1
+        self.last_render = (fingerprints, self.canvas.data)
+        if key is not None:
+            with profiler.span("frame_cache", "camera"):
+                self.cache.put(key, self.canvas.data)
+        return self.canvas.data
+
+    def count_cache_hit(self, hit):
+        """Count a frame cache lookup"""
+        self.last_cache_hit = hit
+        self.render_stats["cache_hits" if hit else "cache_misses"] += 1
+
+    def reuse_frame(self, data):
+        """Count a frame that didn't need to be drawn or stored again"""
+        self.render_stats["reused"] += 1
+        self.render_stats["bytes_saved"] += data.nbytes
+        return data
+
+    def receive_frame(self, data, reused=False, cache_hit=None):
+        """Convert raw frame bytes from a worker, sharing the last frame if
+        identical
+
+        reused -- Whether the worker reused its previous frame
+        cache_hit -- Whether the worker got the frame from the frame cache,
+                     None if it didn't look
+
+        Each frame is counted once, by what the worker did
+        """
+        if cache_hit is not None:
+            self.count_cache_hit(cache_hit)
+        if reused:
+            self.render_stats["reused"] += 1
+        elif not cache_hit:
+            self.render_stats["rendered"] += 1
+        # Workers only see their own frames, so a frame can still be the
+        # same as the last one received, it's then only stored once
+        if (self.dedupe_frames and self.last_received is not None and
+                self.last_received[0] == data):
+            self.render_stats["bytes_saved"] += len(data)
+            return self.last_received[1]
+        frame = helpers.frame_from_bytes(data, self.width, self.height)
+        self.last_received = (data, frame)
+        return frame
+
+    def render_summary(self):
+        """Describe how much work frame deduplication saved"""
+        stats = self.render_stats
+        summary = "Rendered {} frames, reused {} unchanged frames ({:.1f} MB)"\
+            .format(stats["rendered"], stats["reused"],
+                    stats["bytes_saved"] / 2.**20)
+        if self.cache is not None:
+            # Workers write to the cache directly
+            self.cache.scan()
+            lookups = stats["cache_hits"] + stats["cache_misses"]
+            summary += "\nFrame cache: {} hits, {} misses ({:.0f}% hit rate)"\
+                ", {:.1f} MB on disk".format(
+                    stats["cache_hits"], stats["cache_misses"],
+                    100. * stats["cache_hits"] / lookups if lookups else 0.,
+                    self.cache.size / 2.**20)
+        return summary
+
+    def get_static_layer(self, objects):
+        """Get the cached frame of the static shapes, redrawing if changed"""
+        for object_ in objects:
+            object_.resolve_transforms()
+        fingerprints = [object_.fingerprint() for object_ in objects]
+        if self.static_layer is None or self.static_layer[0] != fingerprints:
+            self.canvas.draw(*objects)
+            self.static_layer = (fingerprints, self.canvas.data)
+        return self.static_layer[1]
+
+    def add_frame(self, data):
+        """Store a rendered frame, encoding it if streaming"""
+        if self.stream is not None:
+            with profiler.span("stream", "camera"):
+                self.stream.write(data)
+        if self.live_frames is not None:
+            # Old frames are dropped when full, so capturing never waits on
+            # the preview
+            self.live_frames.append((self.captured, data))
+        self.captured += 1
+        self.frames.append(data)
+
+    def capture_frames(self, scene, count, workers=1):
+        """Create frames from a scene, optionally in parallel
+
+        scene -- Picklable callable returning the Shape objects to draw for
+                 frame i, the result must only depend on i. Workers are
+                 spawned, so its class must be importable (not defined in
+                 a function or an interactive session)
+        count -- Number of frames to capture
+        workers -- Number of worker processes, or None for one per CPU
+        """
+        if workers is None:
+            workers = os.cpu_count() or 1
+        assert isinstance(workers, int), "Workers can only be an integer"
+        assert workers > 0, "Workers must be positive"
+        if workers == 1:
+            for i in range(count):
+                self.capture_frame(*scene(i))
+            return
+        config = dict(width=self.width, height=self.height,
+                      canvas_config=self.canvas_config,
+                      cache_static=self.cache_static,
+                      dedupe_frames=self.dedupe_frames,
+                      frame_cache=self.frame_cache,
+                      frame_cache_size=self.frame_cache_size)
+        # Only keep a few frames in flight so memory stays bounded
+        pending = collections.deque()
+        # Workers are spawned rather than forked, forking while other threads
+        # (Tk, prefetching, encoding) run can leave their locks held in the
+        # child
+        with concurrent.futures.ProcessPoolExecutor(
+                max_workers=workers, initializer=init_worker,
+                initargs=(scene, config),
+                mp_context=multiprocessing.get_context("spawn")) as executor:
+            for i in range(count):
+                pending.append(executor.submit(render_frame, i))
+                if len(pending) >= 2 * workers:
+                    self.add_worker_frame(pending.popleft())
+            while pending:
+                self.add_worker_frame(pending.popleft())
+
+    def add_worker_frame(self, future):
+        """Wait for a frame from a worker process and store it"""
+        with profiler.span("wait", "camera"):
+            data, reused, cache_hit = future.result()
+        with profiler.span("frame", "camera", frame=self.captured):
+            self.add_frame(self.receive_frame(data, reused, cache_hit))
+
+    def start_stream(self, filename, fps=helpers.DEF_FPS, show_loop=False,
+                     window=1, quality="final"):
+        """Encode frames to a file as they are captured
+
+        filename -- Video or image sequence to write to, see
+                    stream.open_stream
+        fps -- Frame rate of the video
+        quality -- Encoding speed/quality profile: draft, review or final
+        show_loop -- Append the frames in reverse for the 'reverse' loop
+                     behavior
+        window -- Number of recent frames kept in memory, or None to keep
+                  every frame, frames in a memmap store are always kept
+        """
+        assert self.stream is None, "Already streaming to a file"
+        self.stream = stream.open_stream(
+            filename, self.width, self.height, fps=fps, quality=quality,
+            reverse=show_loop is True and self.loop_behavior == "reverse")
+        if self.frame_store == "memory":
+            self.frames = collections.deque(self.frames, maxlen=window)
+
+    def stop_stream(self):
+        """Finish encoding the streamed frames"""
+        assert self.stream is not None, "Not streaming to a file"
+        self.stream.close()
+        self.stream = None
+
+    def capture_live(self, scene, count, workers=1, queue_size=2,
+                     **kwargs):
+        """Capture frames in a background thread, showing them in a tk window
+        as they arrive
+
+        The window loops over the frames once capturing is done. Closing it
+        early still waits for the capture to finish.
+
+        scene, count, workers -- See capture_frames
+        queue_size -- Number of captured frames waiting to be shown
+        kwargs -- TkCamera config
+        """
+        self.live_frames = collections.deque(maxlen=queue_size)
+        self.live_done = threading.Event()
+        errors = []
+        thread = threading.Thread(target=self.capture_thread, daemon=True,
+                                  args=(scene, count, workers, errors))
+        thread.start()
+        try:
+            self.show(live=True, **kwargs)
+        finally:
+            if thread.is_alive():
+                self.log("Waiting for capture to finish")
+            thread.join()
+            self.live_frames = self.live_done = None
+        if errors:
+            raise errors[0]
+
+    def capture_thread(self, scene, count, workers, errors):
+        """Run capture_frames, keeping any error for the calling thread"""
+        try:
+            self.capture_frames(scene, count, workers=workers)
+        except Exception as e:
+            errors.append(e)
+        finally:
+            self.live_done.set()
 
     def show(self, **kwargs):
         """Show the frames in a tk window"""
         TkCamera(self, **kwargs)
 
-    def write_to_file(self, filename, fps=helpers.DEF_FPS, show_loop=False):
-        """Save frames to a file
+    def write_to_file(self, filename, fps=helpers.DEF_FPS, show_loop=False,
+                      quality="final", segments=1):
+        """Save frames to a video or image sequence, see start_stream
 
-        Source:
-        http://zulko.github.io/blog/2013/09/27/
-            read-and-write-video-frames-in-python-using-ffmpeg/
+        segments -- Number of FFmpeg processes encoding parts of the video at
+                    the same time, only for mp4 and webm
         """
-        assert isinstance(filename, str), "You must supply a valid filename"
-        assert filename[-4:] == ".mp4", "Can only save to an mp4"
-        assert isinstance(fps, int), "FPS can only be an integer"
-        assert fps > 0, "FPS must be positive"
-        print("Writing frames to temporary file")
-        absfile = os.path.abspath(filename)
-        abspre, absext = os.path.splitext(absfile)
-        tempfile = abspre + ".temp" + absext
-        filedir = os.path.dirname(absfile)
-        if not os.path.isdir(filedir):
-            os.makedirs(filedir)
-        command = [
-            helpers.FFMPEG_BIN,
-            "-y",  # Overwrite
-            "-f", "rawvideo",
-            "-vcodec", "rawvideo",
-            "-s", "{}x{}".format(self.width, self.height),
-            "-pix_fmt", "rgba",
-            "-r", str(fps),
-            "-i", "-",  # From pipe
-            "-an",  # No audio
-            "-vcodec", "libx264",
-            "-pix_fmt", "yuv420p",
-            "-crf", "17",
-            "-loglevel", "error",
-            tempfile
-        ]
-        pipe = subprocess.Popen(command, stdin=subprocess.PIPE,
-                                stderr=subprocess.PIPE)
-        if pipe is None:
-            raise IOError("Could not start FFMPEG with given parameters: " +
-                          " ".join(command))
-        try:
-            for frame in self.frames:
-                pipe.stdin.write(frame.tostring())
-            if show_loop is True and self.loop_behavior == "reverse":
-                for frame in reversed(self.frames):
-                    pipe.stdin.write(frame.tostring())
-        except IOError:
-            print(pipe.communicate()[1])
-            raise IOError()
-        pipe.stdin.close()
-        if pipe.stderr is not None:
-            pipe.stderr.close()
-        pipe.wait()
-        print("Renaming temporary file")
-        shutil.move(tempfile, absfile)
-        print(f"Saved to '{filename}' successfully")
+        frames = list(self.frames)
+        if show_loop is True and self.loop_behavior == "reverse":
+            frames += frames[::-1]
+        if stream.can_segment(filename, len(frames), segments):
+            try:
+                stream.write_segments(frames, filename, self.width,
+                                      self.height, segments, fps=fps,
+                                      quality=quality)
+                return
+            except IOError as e:
+                self.log(f"Segmented encoding failed, using one process: {e}")
+        video = stream.open_stream(filename, self.width, self.height, fps=fps,
+                                   quality=quality)
+        for frame in frames:
+            with profiler.span("write", "camera"):
+                video.write(frame)
+        with profiler.span("close", "camera"):
+            video.close()
+
+
+# Per-process state for capture_frames workers
+WORKER = {}
+
+
+def init_worker(scene, camera_config):
+    """Give a worker process its own scene and Camera (and Canvas)"""
+    # Spawned workers start without a profiler, unless the main module
+    # starts one when it's imported again. Spans in a worker would never be
+    # collected
+    profiler.stop()
+    WORKER["scene"] = scene
+    WORKER["camera"] = Camera(**camera_config)
+
+
+def render_frame(i):
+    """Render frame i in a worker process
+
+    Returns: (raw RGBA bytes, whether the previous frame was reused,
+              whether it came from the frame cache)
+    """
+    camera = WORKER["camera"]
+    data = camera.render(*WORKER["scene"](i)).tobytes()
+    return data, camera.last_reused, camera.last_cache_hit
 
 
 class TkCamera(tkinter.Tk):
-    """Tk window for displaying camera data"""
+    """Tk window for displaying camera data
+
+    A background thread converts (and resizes) upcoming frames to PIL
+    images, which are turned into PhotoImages on the Tk thread when it has
+    time to spare. Both are kept in bounded caches.
+
+    In live mode, frames are taken from the camera's live_frames as they are
+    captured, and playback starts once the capture is done.
+    """
 
     CONFIG = {
         "fps": helpers.DEF_FPS,
@@ -105,6 +411,9 @@ class TkCamera(tkinter.Tk):
         "frame": 0,
         "frame_speed": 1,
         "padding": 1,
+        "cache_size": 32,  # Number of display-ready frames kept
+        "prefetch": 8,  # Number of frames prepared ahead of the current one
+        "live": False,  # Show frames while the camera is capturing them
         "temp": {}
     }
 
@@ -112,86 +421,232 @@ class TkCamera(tkinter.Tk):
         helpers.handle_config(self, kwargs, dict(camera=camera,
                                                  height=camera.height,
                                                  width=camera.width))
+        assert self.prefetch <= self.cache_size, \
+            "Can't prefetch more frames than are cached"
         tkinter.Tk.__init__(self)
         # Setup Tk
         w, h, p = self.width, self.height, self.padding
         self.geometry("{}x{}".format(w + 2 * p, h + 2 * p))
         self.resizable(0, 0)
         self.bind("<Key>", self.cb_key)
-        # Create canvas object
+        # Create canvas object, its items are updated in place
         self.canvas = tkinter.Canvas(self, width=w, height=h, bg="black")
         self.canvas.pack()
-        # Display the first frame
+        self.image_item = self.canvas.create_image(p, p, anchor="nw")
+        self.text_item = self.canvas.create_text(p, p, fill="#FFFFFF",
+                                                 anchor="nw", state="hidden")
+        # PIL images are shared with the prefetch thread, PhotoImages can only
+        # be used on the Tk thread
+        self.images = helpers.LRUCache(max_size=self.cache_size)
+        self.photos = helpers.LRUCache(max_size=self.cache_size)
+        self.lock = threading.Condition()
+        self.upcoming = None
+        self.running = True
+        self.convert_time = 0.
+        # Display times of recent frames, for the measured fps
+        self.shown = collections.deque(maxlen=max(2, int(self.fps)))
+        self.prefetcher = threading.Thread(target=self.prefetch_frames,
+                                           daemon=True)
+        self.prefetcher.start()
+        if self.live:
+            assert self.camera.live_frames is not None, \
+                "Camera isn't capturing live"
+        else:
+            self.start_playback()
+        # Run loop
+        self.next_time = time.monotonic() + self.interval()
+        self.after(self.delay(), self.step)
+        self.mainloop()
+
+    def start_playback(self):
+        """Display the first frame and prepare to animate"""
         if self.camera.frames:
             self.update_frame()
         # Don't animate without multiple frames
         if len(self.camera.frames) < 2:
             self.frame_speed = 0
-        # Run loop
-        self.step()
-        self.mainloop()
 
-    def update_frame(self):
-        """Display the current frame"""
-        # Clear previous frame
-        self.canvas.delete("all")
-        # Convert to displayable image
-        data = self.camera.frames[self.frame]
-        self.temp["img"] = helpers.image_from_array(data)
+    def destroy(self):
+        """Stop the prefetch thread and close the window"""
+        with self.lock:
+            self.running = False
+            self.lock.notify()
+        tkinter.Tk.destroy(self)
+
+    def interval(self):
+        """Seconds between frames"""
+        return 1. / self.fps if self.fps != 0 else 0.
+
+    def delay(self):
+        """Milliseconds until the next frame is due"""
+        return max(1, int(round((self.next_time - time.monotonic()) * 1000)))
+
+    def next_frame(self, frame, frame_speed):
+        """Get the (frame, frame_speed) after the given one, handling the loop
+        behavior"""
+        count = len(self.camera.frames)
+        if frame_speed > 0 and frame + frame_speed >= count:
+            if self.camera.loop_behavior == "loop":
+                return frame + frame_speed - count, frame_speed
+            elif self.camera.loop_behavior == "reverse":
+                return 2 * count - (frame + frame_speed) - 1, -frame_speed
+            return count - 1, 0  # once
+        elif frame_speed < 0 and frame + frame_speed < 0:
+            if self.camera.loop_behavior == "loop":
+                return frame + frame_speed + count, frame_speed
+            elif self.camera.loop_behavior == "reverse":
+                return -(frame + frame_speed), -frame_speed
+            return 0, 0  # once
+        return frame + frame_speed, frame_speed
+
+    def upcoming_frames(self):
+        """Indices of the frames that will be shown next, current included"""
+        frame, frame_speed = self.frame, self.frame_speed
+        frames = [frame]
+        while frame_speed != 0 and len(frames) < self.prefetch:
+            frame, frame_speed = self.next_frame(frame, frame_speed)
+            frames.append(frame)
+        return frames
+
+    def prepare_image(self, data):
+        """Convert frame data to a PIL image of the display size"""
+        image = helpers.image_from_array(data)
         if (self.width, self.height) != (self.camera.width,
                                          self.camera.height):
-            self.temp["img"] = self.temp["img"].resize((self.width,
-                                                        self.height))
-        self.temp["imgP"] = PIL.ImageTk.PhotoImage(image=self.temp["img"])
-        # Add image to canvas
-        self.temp["imgC"] = self.canvas.create_image(
-            self.padding, self.padding, image=self.temp["imgP"], anchor="nw")
-        # Add paused notice
+            image = image.resize((self.width, self.height))
+        return image
+
+    def prefetch_frames(self):
+        """Prepare upcoming frames in the background"""
+        while True:
+            with self.lock:
+                while self.running and self.upcoming is None:
+                    self.lock.wait()
+                if not self.running:
+                    return
+                frames, self.upcoming = self.upcoming, None
+            for frame in frames:
+                with self.lock:
+                    if not self.running or self.upcoming is not None:
+                        break
+                    if frame in self.images:
+                        continue
+                image = self.prepare_image(self.camera.frames[frame])
+                with self.lock:
+                    self.images.put(frame, image)
+
+    def get_photo(self, frame):
+        """Get the PhotoImage of a frame, converting it if needed"""
+        photo = self.photos.get(frame)
+        if photo is None:
+            start = time.monotonic()
+            with self.lock:
+                image = self.images.get(frame)
+            if image is None:
+                image = self.prepare_image(self.camera.frames[frame])
+            photo = PIL.ImageTk.PhotoImage(image=image)
+            self.photos.put(frame, photo)
+            self.convert_time = time.monotonic() - start
+        return photo
+
+    def fill_photos(self):
+        """Convert prepared frames while waiting for the next one"""
+        for frame in self.upcoming_frames()[1:]:
+            if frame in self.photos:
+                continue
+            with self.lock:
+                ready = frame in self.images
+            if (not ready or
+                    time.monotonic() + self.convert_time > self.next_time):
+                return
+            self.get_photo(frame)
+            # Let Tk handle events before converting another
+            self.after_idle(self.fill_photos)
+            return
+
+    def measured_fps(self):
+        """Frame rate of recent playback"""
+        if len(self.shown) < 2 or self.shown[-1] == self.shown[0]:
+            return 0.
+        return (len(self.shown) - 1) / (self.shown[-1] - self.shown[0])
+
+    def show_photo(self, photo):
+        """Put a PhotoImage on the canvas and update the paused notice"""
+        # Keep a reference, Tk doesn't and the cache may drop it
+        self.temp["imgP"] = photo
+        self.canvas.itemconfigure(self.image_item, image=photo)
         if self.paused:
-            self.temp["paused"] = self.canvas.create_text(
-                self.padding, self.padding, text="PAUSED {}/{}".format(
-                    self.frame + 1, len(self.camera.frames)), fill="#FFFFFF",
-                anchor="nw")
+            self.canvas.itemconfigure(
+                self.text_item, state="normal",
+                text="PAUSED {}/{} ({:.1f} fps)".format(
+                    self.frame + 1, len(self.camera.frames),
+                    self.measured_fps()))
+        else:
+            self.canvas.itemconfigure(self.text_item, state="hidden")
+            self.shown.append(time.monotonic())
+
+    def update_frame(self):
+        """Display the current frame"""
+        if self.live:
+            if "imgP" in self.temp:
+                self.show_photo(self.temp["imgP"])
+            return
+        self.show_photo(self.get_photo(self.frame))
+        # Ask for the next frames
+        with self.lock:
+            self.upcoming = self.upcoming_frames()
+            self.lock.notify()
+        self.after_idle(self.fill_photos)
+
+    def step_live(self):
+        """Show the newest captured frame, starting playback when done"""
+        latest = None
+        while self.camera.live_frames:
+            latest = self.camera.live_frames.popleft()
+        if latest is not None and not self.paused:
+            self.frame, data = latest
+            self.show_photo(PIL.ImageTk.PhotoImage(
+                image=self.prepare_image(data)))
+        if self.camera.live_done.is_set() and not self.camera.live_frames:
+            self.live = False
+            self.frame = 0
+            self.start_playback()
 
     def step(self):
         """Handle changing frames"""
+        if self.live:
+            self.step_live()
+            self.next_time = time.monotonic() + self.interval()
+            self.after(self.delay(), self.step)
+            return
         # Handle animation end
         if self.frame_speed == 0:
             # Won't update again
             return
-        # Update screen if not paused
-        if not self.paused or self.do_step:
-            self.do_step = False
-            # Next frame, handle loop behavior
-            if (self.frame_speed > 0 and self.frame + self.frame_speed
-                    >= len(self.camera.frames)):
-                if self.camera.loop_behavior == "loop":
-                    self.frame = (self.frame + self.frame_speed
-                                  - len(self.camera.frames))
-                elif self.camera.loop_behavior == "reverse":
-                    self.frame = (2 * len(self.camera.frames)
-                                  - (self.frame + self.frame_speed) - 1)
-                    self.frame_speed *= -1
-                else:  # once
-                    self.frame = len(self.camera.frames) - 1
-                    self.frame_speed = 0
-            elif self.frame_speed < 0 and self.frame + self.frame_speed < 0:
-                if self.camera.loop_behavior == "loop":
-                    self.frame = (self.frame + self.frame_speed
-                                  + len(self.camera.frames))
-                elif self.camera.loop_behavior == "reverse":
-                    self.frame = -(self.frame + self.frame_speed)
-                    self.frame_speed *= -1
-                else:  # once
-                    self.frame = 0
-                    self.frame_speed = 0
-            else:
-                self.frame += self.frame_speed
+        now = time.monotonic()
+        interval = self.interval()
+        if self.paused:
+            if self.do_step:
+                self.do_step = False
+                self.frame, self.frame_speed = self.next_frame(
+                    self.frame, self.frame_speed)
+                self.update_frame()
+            self.next_time = now + interval
+        else:
+            # Skip the frames there wasn't time to show
+            steps = 1
+            if interval and now > self.next_time:
+                steps += int((now - self.next_time) / interval)
+            for _ in range(steps):
+                if self.frame_speed == 0:
+                    break
+                self.frame, self.frame_speed = self.next_frame(
+                    self.frame, self.frame_speed)
             # Display current frame
             self.update_frame()
-        # Call step again later
-        delay = int(math.ceil(1000. / self.fps)) if self.fps != 0 else 1
-        self.after(delay, self.step)
+            self.next_time += steps * interval
+        # Call step again when the next frame is due
+        self.after(self.delay(), self.step)
 
     def cb_key(self, event):
         """Callback for key events"""
@@ -201,6 +656,8 @@ class TkCamera(tkinter.Tk):
             self.destroy()
         elif key == "p":
             self.paused = not self.paused
+            if not self.paused:
+                self.shown.clear()
             self.update_frame()
         elif key in ("enter", "space"):
             if self.paused:
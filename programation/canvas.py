@@ -3,8 +3,10 @@ from copy import deepcopy
 import numpy
 
 import aggdraw
+import PIL.Image
 
 import programation.helpers as helpers
+import programation.profiler as profiler
 import programation.shape as shape
 
 
@@ -13,18 +15,32 @@ class Canvas(object):
 
     CONFIG = {
         "width": helpers.DEF_WIDTH,
-        "height": helpers.DEF_HEIGHT
+        "height": helpers.DEF_HEIGHT,
+        "cull": True  # Skip shapes that are entirely off the canvas
     }
 
     def __init__(self, **kwargs):
         self.drawing = self.hasTransform = self.img = False
 
         helpers.handle_config(self, kwargs)
-        self.data = numpy.zeros((self.height, self.width, 4))
+        self.data = helpers.empty_frame(self.width, self.height)
+
+    def __getstate__(self):
+        # The aggdraw surface can't be copied, it is recreated on demand
+        state = self.__dict__.copy()
+        state["drawing"] = state["hasTransform"] = state["img"] = False
+        return state
 
     def copy(self):
         return deepcopy(self)
 
+    def setup_surface(self):
+        """Create the image and aggdraw surface reused by every frame"""
+        if not self.img:
+            self.img = PIL.Image.new("RGBA", (self.width, self.height))
+        if not self.drawing:
+            self.drawing = aggdraw.Draw(self.img)
+
     def draw(self, *shapes_, **kwargs):
         """Draw a list of shapes to the internal pixel data array
 
@@ -40,30 +56,45 @@ class Canvas(object):
         for shape_ in shapes_:
             assert isinstance(shape_, shape.Shape), \
                 "Can only draw shapes to a canvas"
-        if background:
+        if background is not None:
             assert isinstance(background, numpy.ndarray), \
                 "Can only use a background stored as a numpy array"
             assert self.data.shape == background.shape, \
                 "Can only use a background of the same dimensions"
         assert not kwargs, "Only supported keyword is 'background'"
-        # Handle background
-        if background:
-            self.data = background.copy()
-        else:
-            self.data = numpy.zeros((self.height, self.width, 4))
-        # Setup the image
-        self.img = helpers.image_from_array(self.data)
-        self.drawing = aggdraw.Draw(self.img)
-        self.hasTransform = False
+        # Setup the surface, clearing it in place
+        with profiler.span("setup", "canvas"):
+            self.setup_surface()
+            if background is not None:
+                self.drawing.frombytes(numpy.ascontiguousarray(
+                    background, dtype=numpy.uint8))
+            else:
+                self.drawing.clear(helpers.CLEAR_COLOR)
+            self.set_transform()
         # Draw each shape
         for shape_ in shapes_:
+            with profiler.span("transforms", "canvas"):
+                shape_.resolve_transforms()
+                if self.cull:
+                    shape_.update_boxes()
             shape_.draw(self)
         # Cleanup
-        self.drawing.flush()
-        del self.hasTransform
-        del self.drawing
-        self.data = numpy.array(self.img)
-        del self.img
+        with profiler.span("flush", "canvas"):
+            self.drawing.flush()
+        with profiler.span("convert", "canvas"):
+            self.data = self.read_frame()
+
+    def read_frame(self):
+        """Copy the drawing surface into a frame array"""
+        return helpers.frame_from_bytes(self.drawing.tobytes(), self.width,
+                                        self.height)
+
+    def is_visible(self, box):
+        """Return if a device space box overlaps the canvas"""
+        if box is None:
+            return False
+        return (box[2] >= 0. and box[3] >= 0. and box[0] <= self.width and
+                box[1] <= self.height)
 
     def set_transform(self, transform=None):
         """Setup the aggdraw transformation"""
@@ -74,5 +105,5 @@ class Canvas(object):
                 self.hasTransform = False
         # Use new transform
         if transform is not None:
-            self.drawing.settransform(transform.to_array())
+            self.drawing.settransform(transform.to_tuple())
             self.hasTransform = True
@@ -1,3 +1,5 @@
+import collections
+import functools
 import math
 
 from colour import Color
@@ -15,6 +17,8 @@ DEF_HEIGHT = 360
 DEF_FPS = 30
 ZERO_TOLERANCE = .1
 FFMPEG_BIN = "ffmpeg"
+CLEAR_COLOR = (0, 0, 0, 0)
+UNBOUNDED_BOX = (-math.inf, -math.inf, math.inf, math.inf)
 
 
 def filter_locals(local_args):
@@ -51,23 +55,139 @@ def combine_configs(configs):
     return config
 
 
-def handle_config(self, kwargs, local_args=None):
-    """Set up object variables based on configs
+# Merged class configurations, see get_config
+CONFIG_CACHE = {}
+
+
+def config_sources(cls):
+    """Get the CONFIG of a class and each superclass (None if it has none)
+    with a copy of its items, to notice when one changes"""
+    sources = []
+    for superclass in cls.__mro__:
+        config = vars(superclass).get("CONFIG")
+        sources.append((config, None if config is None
+                        else list(config.items())))
+    return sources
+
+
+def are_sources_current(cls, sources):
+    """Return if no CONFIG was replaced or had an item changed since
+    config_sources"""
+    for superclass, (source, items) in zip(cls.__mro__, sources):
+        config = vars(superclass).get("CONFIG")
+        if config is not source:
+            return False
+        if config is None:
+            continue
+        if len(config) != len(items):
+            return False
+        for key, value in items:
+            if config.get(key, sources) is not value:
+                return False
+    return True
 
-    Source: manim
+
+def get_config(cls):
+    """Get the combined configuration of a class and its superclasses
+
+    Returns: (config, keys of mutable values)
+
+    The result is cached, and recomputed if any CONFIG is replaced or has
+    an item added, removed or set to another value.
     """
+    cached = CONFIG_CACHE.get(cls)
+    if cached is not None and are_sources_current(cls, cached[0]):
+        return cached[1:]
     # Get all superclass configurations
-    superclasses = [self.__class__]
+    superclasses = [cls]
     configs = list()
     while any(superclasses):
         superclass = superclasses.pop()
         superclasses += superclass.__bases__
-        if hasattr(superclass, "CONFIG"):
+        if "CONFIG" in vars(superclass):
             configs.append(superclass.CONFIG)
-    # Create priority order of configs
-    all_configs = [kwargs, filter_locals(local_args), self.__dict__]
-    all_configs += configs
-    self.__dict__ = combine_configs(all_configs)
+    config = combine_configs(configs)
+    # Mutable defaults are copied per instance
+    mutable = [key for key, value in config.items()
+               if not isinstance(value, type) and
+               callable(getattr(type(value), "copy", None))]
+    CONFIG_CACHE[cls] = (config_sources(cls), config, mutable)
+    return config, mutable
+
+
+def handle_config(self, kwargs, local_args=None):
+    """Set up object variables based on configs
+
+    Priority: kwargs, local_args, existing attributes, class CONFIGs
+
+    Source: manim
+    """
+    instance = self.__dict__
+    config, mutable = get_config(self.__class__)
+    if not instance.keys() >= config.keys():
+        instance.update({**config, **instance})
+        for key in mutable:
+            if instance[key] is config[key]:
+                instance[key] = config[key].copy()
+    for overrides in (filter_locals(local_args), kwargs):
+        for key, value in overrides.items():
+            current = instance.get(key)
+            if isinstance(value, dict) and isinstance(current, dict):
+                # Combine two child configs
+                value = combine_configs([value, current])
+            instance[key] = value
+
+
+class LRUCache(object):
+    """Bounded mapping that drops the least recently used items"""
+
+    CONFIG = {
+        "max_size": 256
+    }
+
+    def __init__(self, **kwargs):
+        handle_config(self, kwargs)
+        self.items = collections.OrderedDict()
+        self.hits = self.misses = 0
+
+    def __len__(self):
+        return len(self.items)
+
+    def __contains__(self, key):
+        return key in self.items
+
+    def get(self, key, create=None):
+        """Get an item, calling create() to make it if missing
+
+        Returns None if missing and create isn't provided
+        """
+        try:
+            value = self.items[key]
+        except KeyError:
+            self.misses += 1
+            if create is None:
+                return None
+            value = create()
+            self.put(key, value)
+            return value
+        self.hits += 1
+        self.items.move_to_end(key)
+        return value
+
+    def put(self, key, value):
+        """Store an item, evicting the oldest if full"""
+        self.items[key] = value
+        self.items.move_to_end(key)
+        while len(self.items) > self.max_size:
+            self.items.popitem(last=False)
+
+    def clear(self):
+        self.items.clear()
+        self.hits = self.misses = 0
+
+    def stats(self):
+        """Return (hits, misses, size)"""
+        return self.hits, self.misses, len(self.items)
 
 
 def change_kwargs(kwargs, **changes):
@@ -101,7 +221,17 @@ def rotation_matrix(angle):
 
 def image_from_array(data):
     """Convert a numpy array to a PIL image"""
-    return PIL.Image.fromarray(numpy.uint8(data))
+    return PIL.Image.fromarray(numpy.asarray(data, dtype=numpy.uint8))
+
+
+def empty_frame(width, height):
+    """Create a blank uint8 RGBA frame"""
+    return numpy.zeros((height, width, 4), dtype=numpy.uint8)
+
+
+def frame_from_bytes(data, width, height):
+    """View raw RGBA bytes as a (height, width, 4) uint8 frame, no copy"""
+    return numpy.frombuffer(data, dtype=numpy.uint8).reshape(height, width, 4)
 
 
 def to_color(col):
@@ -186,65 +316,199 @@ def is_path_closed(points):
     return scipy.linalg.norm(points[0] - points[-1]) <= ZERO_TOLERANCE
 
 
-def get_smooth_handles(points):
-    """Get handles for a smooth bezier curve spline
+def smooth_system(points):
+    """Get the tridiagonal system for the first handles of a smooth spline
+
+    Substituting the second handles into the spline equations leaves one
+    tridiagonal row per curve:
+    P1[i - 1] + 4 * P1[i] + P1[i + 1] = 4 * K[i] + 2 * K[i + 1]
+
+    Closed paths wrap around, their corner coefficients are left for the
+    Sherman-Morrison correction (see get_smooth_handles_batch)
+
+    Returns: (sub, diag, super, rhs, is_closed)
+    """
+    count = len(points) - 1
+    is_closed = count > 1 and is_path_closed(points)
+    sub, diag, sup = numpy.ones(count), 4. * numpy.ones(count), \
+        numpy.ones(count)
+    sub[0] = sup[-1] = 0.
+    if is_closed:
+        knots = points[:-1]
+        rhs = 4. * knots + 2. * numpy.roll(knots, -1, axis=0)
+    elif count == 1:
+        diag[0] = 3.
+        rhs = 2. * points[0:1] + points[1:2]
+    else:
+        rhs = 4. * points[:-1] + 2. * points[1:]
+        # Eq 3
+        diag[0] = 2.
+        rhs[0] = points[0] + 2. * points[1]
+        # Eq 4
+        sub[-1], diag[-1] = 2., 7.
+        rhs[-1] = 8. * points[-2] + points[-1]
+    return sub, diag, sup, rhs, is_closed
+
+
+def get_smooth_handles_batch(paths):
+    """Get handles for many smooth bezier curve splines at once
+
+    All paths are solved together as one block-diagonal banded system, in
+    time and memory linear in the total number of points. Closed paths
+    are cyclic tridiagonal, and are handled with the Sherman-Morrison
+    formula.
+
+    paths -- List of (n + 1, dim) arrays of anchor points, all with the
+             same dim
+
+    Returns: List of (2, n, dim) arrays of handles
 
     Sources:
     https://www.particleincell.com/2012/bezier-splines/
         ~ Equations referenced
     https://github.com/3b1b/manim/blob/master/helpers.py
         ~ get_smooth_handle_points
+    https://en.wikipedia.org/wiki/Tridiagonal_matrix_algorithm
+        ~ Variants
     """
-    count = len(points) - 1
-    dim = points.shape[1]
-    is_closed = is_path_closed(points)
-    A = numpy.zeros((2 * count, 2 * count))
-    B = numpy.zeros((2 * count, dim))
-    # First row
-    if is_closed:  # Eq 2
-        A[0, [-2, -1, 0, 1]] = [1, -2, 2, -1]
-    else:  # Eq 3
-        A[0, 0:2] = [2, -1]
-        B[0] = points[0]
-    # Middle
-    for i in range(1, count):
-        j = 2 * i - 1
-        # Eq 1
-        A[j, j: j + 2] = [1, 1]
-        B[j] = 2 * points[i]
-        # Eq 2
-        A[j + 1, j - 1: j + 3] = [1, -2, 2, -1]
-    # Last row
-    if is_closed:  # Eq 1
-        A[-1, [-1, 0]] = [1, 1]
-        B[-1] = 2 * points[0]
-    else:  # Eq 4
-        A[-1, -2:] = [-1, 2]
-        B[-1] = points[-1]
-    # Solving: A * X = B
-    if is_closed:  # Solve as whole matrix
-        X = scipy.linalg.solve(A, B)
-    else:  # Solve as banded matrix
-        l, u = 2, 1
-        AB = numpy.zeros((l + u + 1, 2 * count))
-        AB[0, 1:] = numpy.diag(A, 1)
-        AB[1] = numpy.diag(A)
-        AB[2, :-1] = numpy.diag(A, -1)
-        AB[3, :-2] = numpy.diag(A, -2)
-        # pylint: disable=no-member
-        X = scipy.linalg.solve_banded((l, u), AB, B)
-    # Parse results
-    P1s = X[0::2]
-    P2s = X[1::2]
-    return numpy.array([P1s, P2s])
+    paths = [numpy.asarray(points, dtype=float) for points in paths]
+    systems = [smooth_system(points) if len(points) > 1 else None
+               for points in paths]
+    solved = [system for system in systems if system is not None]
+    if not solved:
+        return [numpy.zeros((2, 0, points.shape[1])) for points in paths]
+    sub, diag, sup, rhs, closed = [list(v) for v in zip(*solved)]
+    sizes = [len(d) for d in diag]
+    starts = numpy.cumsum([0] + sizes)
+    # Sherman-Morrison: A = T + u * v^T, the corners are
+    # A[0, n - 1] = A[n - 1, 0] = 1, with gamma = -A[0, 0]
+    u = numpy.zeros(starts[-1])
+    for i, is_closed in enumerate(closed):
+        if is_closed:
+            gamma = -diag[i][0]
+            diag[i] = diag[i].copy()
+            diag[i][0] -= gamma
+            diag[i][-1] -= 1. / gamma
+            u[starts[i]] = gamma
+            u[starts[i + 1] - 1] = 1.
+    # Solving: T * [Y, Z] = [B, u]
+    AB = numpy.zeros((3, starts[-1]))
+    AB[0, 1:] = numpy.concatenate(sup)[:-1]
+    AB[1] = numpy.concatenate(diag)
+    AB[2, :-1] = numpy.concatenate(sub)[1:]
+    dim = rhs[0].shape[1]
+    B = numpy.concatenate([numpy.concatenate(rhs), u[:, None]], axis=1)
+    # pylint: disable=no-member
+    X = scipy.linalg.solve_banded((1, 1), AB, B)
+    results = []
+    indices = iter(range(len(sizes)))
+    for points, system in zip(paths, systems):
+        if system is None:
+            results.append(numpy.zeros((2, 0, points.shape[1])))
+            continue
+        i = next(indices)
+        start, end = starts[i], starts[i + 1]
+        P1s = X[start:end, :dim]
+        if closed[i]:
+            # x = y - (v . y) / (1 + v . z) * z, with v = [1, 0, ..., 1/gamma]
+            z = X[start:end, dim]
+            gamma = u[start]
+            factor = ((P1s[0] + P1s[-1] / gamma) /
+                      (1. + z[0] + z[-1] / gamma))
+            P1s = P1s - factor * z[:, None]
+            knots = points[:-1]
+            P2s = 2. * numpy.roll(knots, -1, axis=0) - \
+                numpy.roll(P1s, -1, axis=0)
+        else:
+            P2s = numpy.empty_like(P1s)
+            P2s[:-1] = 2. * points[1:-1] - P1s[1:]
+            P2s[-1] = (points[-1] + P1s[-1]) / 2.
+        results.append(numpy.array([P1s, P2s]))
+    return results
+
+
+def get_smooth_handles(points):
+    """Get handles for a smooth bezier curve spline
+
+    Returns: (2, n, dim) array of handles
+    """
+    return get_smooth_handles_batch([points])[0]
+
+
+@functools.lru_cache(maxsize=None)
+def bezier_basis(degree):
+    """Get the matrix converting bezier control points to polynomial
+    coefficients, and its inverse
+
+    Row j of the first matrix holds the coefficient of t^j for each control
+    point
+    """
+    n = degree
+    basis = numpy.zeros((n + 1, n + 1))
+    for k in range(n + 1):
+        for j in range(k, n + 1):
+            basis[j, k] = (scipy.special.comb(n, k) *
+                           scipy.special.comb(n - k, j - k) * (-1)**(j - k))
+    inverse = numpy.linalg.inv(basis)
+    basis.setflags(write=False)
+    inverse.setflags(write=False)
+    return basis, inverse
+
+
+def bezier_split_matrices(a, b, degree=3):
+    """Get the matrices mapping control points to those of [a, b]
+
+    a, b -- Scalars or arrays of interval bounds, broadcast together
+
+    Returns: (..., degree + 1, degree + 1) array
+    """
+    a, b = numpy.broadcast_arrays(numpy.asarray(a, dtype=float),
+                                  numpy.asarray(b, dtype=float))
+    n = degree
+    basis, inverse = bezier_basis(n)
+    # Substituting t = a + (b - a) * u into the power basis:
+    # t^k = sum_j C(k, j) * a^(k - j) * (b - a)^j * u^j
+    j = numpy.arange(n + 1)
+    power = j[None, :] - j[:, None]
+    binomials = numpy.where(power >= 0, scipy.special.comb(j[None, :],
+                                                           j[:, None]), 0.)
+    a_powers = a[..., None, None] ** numpy.maximum(power, 0)
+    ba_powers = (b - a)[..., None, None] ** j[:, None]
+    substitution = numpy.where(power >= 0, binomials * a_powers * ba_powers,
+                               0.)
+    return inverse @ substitution @ basis
+
+
+@functools.lru_cache(maxsize=None)
+def bezier_subdivision_matrices(count, degree=3):
+    """Get the cached matrices splitting a curve into count equal parts
+
+    Returns: (count, degree + 1, degree + 1) array
+    """
+    bounds = numpy.linspace(0., 1., count + 1)
+    matrices = bezier_split_matrices(bounds[:-1], bounds[1:], degree)
+    matrices.setflags(write=False)
+    return matrices
 
 
 def calc_bezier(points, t):
-    n = len(points) - 1
-    result = numpy.zeros(points.shape[1])
-    for i, v in enumerate(points):
-        result += scipy.special.comb(n, i) * (t**i) * ((1-t)**(n-i)) * v
-    return result
+    """Get the point at t of a bezier curve"""
+    points = numpy.asarray(points, dtype=float)
+    basis, _ = bezier_basis(len(points) - 1)
+    return (t ** numpy.arange(len(points))) @ basis @ points
+
+
+def split_beziers(curves, a, b):
+    """Split a stack of bezier curves for [a, b]
+
+    curves -- (N, degree + 1, dim) array of control points
+    a, b -- Scalars or (N,) arrays of interval bounds
+
+    Source:
+    https://pomax.github.io/bezierinfo/#matrixsplit
+    """
+    curves = numpy.asarray(curves, dtype=float)
+    return bezier_split_matrices(a, b, curves.shape[-2] - 1) @ curves
 
 
 def split_bezier(points, a, b):
@@ -255,14 +519,67 @@ def split_bezier(points, a, b):
     https://github.com/3b1b/manim/blob/master/helpers.py
         ~ partial_bezier_points
     """
-    a_to_1 = numpy.array([
-        calc_bezier(points[i:], a)
-        for i in range(len(points))
-    ])
-    return numpy.array([
-        calc_bezier(a_to_1[:i+1], (b-a)/(1.-a))
-        for i in range(len(points))
-    ])
+    return split_beziers(points, a, b)
+
+
+def points_box(points):
+    """Get the (x0, y0, x1, y1) box around (N, 2) points"""
+    return tuple(points.min(axis=0).tolist() + points.max(axis=0).tolist())
+
+
+def bezier_box(curves):
+    """Get the tight (x0, y0, x1, y1) box around (N, 4, 2) cubic curves
+
+    Uses the end points and wherever the derivative is zero
+
+    Source:
+    https://pomax.github.io/bezierinfo/#extremities
+    """
+    p0, p1, p2, p3 = [curves[:, i] for i in range(4)]
+    # B'(t) / 3 = a * t^2 + b * t + c
+    a = 3. * (p1 - p2) + p3 - p0
+    b = 2. * (p0 - 2. * p1 + p2)
+    c = p1 - p0
+    with numpy.errstate(divide="ignore", invalid="ignore"):
+        root = numpy.sqrt(b * b - 4. * a * c)
+        quadratic = numpy.abs(a) > 1e-12
+        roots = [numpy.where(quadratic, (-b + sign * root) / (2. * a),
+                             -c / b) for sign in (1., -1.)]
+    ts = [numpy.zeros_like(a), numpy.ones_like(a)]
+    for t in roots:
+        # Unusable roots are replaced by an end point
+        ts.append(numpy.where(numpy.isfinite(t) & (t > 0.) & (t < 1.), t,
+                              0.))
+    t = numpy.stack(ts)
+    mt = 1. - t
+    values = (mt ** 3 * p0 + 3. * mt ** 2 * t * p1 + 3. * mt * t ** 2 * p2 +
+              t ** 3 * p3)
+    return points_box(values.reshape(-1, values.shape[-1]))
+
+
+def transform_box(transform_, box, pad=0.):
+    """Get the box around a transformed box, grown by pad on all sides"""
+    if any(math.isinf(v) for v in box):
+        return UNBOUNDED_BOX
+    x0, y0, x1, y1 = box
+    if transform_ is not None:
+        xs, ys = zip(*[transform_.apply(x, y)
+                       for x, y in ((x0, y0), (x1, y0), (x0, y1), (x1, y1))])
+        x0, y0, x1, y1 = min(xs), min(ys), max(xs), max(ys)
+        # The stroke is scaled by the transform as well
+        a, b, _, d, e, _ = transform_.to_tuple()
+        pad *= max(1., abs(a) + abs(b), abs(d) + abs(e))
+    return (x0 - pad, y0 - pad, x1 + pad, y1 + pad)
+
+
+def union_boxes(a, b):
+    """Get the box around both boxes, either may be None"""
+    if a is None:
+        return b
+    if b is None:
+        return a
+    return (min(a[0], b[0]), min(a[1], b[1]), max(a[2], b[2]),
+            max(a[3], b[3]))
 
 
 def interpolate(a, b, t):
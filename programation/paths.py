@@ -0,0 +1,80 @@
+import functools
+import re
+
+import numpy
+
+import aggdraw
+
+# Path commands whose numbers are all absolute control points
+ABSOLUTE_COMMANDS = set("MLCQZ")
+NUMBER_PATTERN = re.compile(r"[-+]?(?:\d+\.?\d*|\.\d+)(?:[eE][-+]?\d+)?")
+COMMAND_PATTERN = re.compile(r"[A-Za-z]")
+
+# Decimal places written for each coordinate, well below the 1/256 pixel
+# resolution used by aggdraw's rasterizer
+PRECISION = 4
+
+
+@functools.lru_cache(maxsize=16)
+def path_template(num_curves, closed=False, precision=PRECISION):
+    """Get a %-format string for a path of cubic bezier curves"""
+    num = "%.{}f".format(precision)
+    move = "M {0} {0}".format(num)
+    curve = " C {0} {0} {0} {0} {0} {0}".format(num)
+    return move + curve * num_curves + (" Z" if closed else "")
+
+
+def join_points(anchors, handles0, handles1):
+    """Interleave anchors and handles into a single points array:
+    [A0, H00, H10, A1, H01, H11, ..., An]
+    """
+    assert len(handles0) == len(handles1), "Handles must have same length"
+    assert len(anchors) == len(handles0) + 1, "# Points = # Handles + 1"
+    anchors = numpy.asarray(anchors)
+    points = numpy.empty((3 * len(handles0) + 1, anchors.shape[1]))
+    points[0::3] = anchors
+    points[1::3] = handles0
+    points[2::3] = handles1
+    return points
+
+
+def split_curves(points):
+    """Get the cubic curves of a joined points array as (N, 4, dim)"""
+    num_curves = max((len(points) - 1) // 3, 0)
+    indices = 3 * numpy.arange(num_curves)[:, None] + numpy.arange(4)
+    return points[indices]
+
+
+def path_coordinates(path):
+    """Get the (x, y) control points of an SVG path as an (N, 2) array
+
+    The curves lie within their control points, so these bound the path.
+    Returns None for relative and other commands that aren't supported.
+    """
+    if not set(COMMAND_PATTERN.findall(path)) <= ABSOLUTE_COMMANDS:
+        return None
+    numbers = NUMBER_PATTERN.findall(path)
+    if not numbers or len(numbers) % 2:
+        return None
+    return numpy.array(numbers, dtype=float).reshape(-1, 2)
+
+
+def bezier_path(points, closed=False, precision=PRECISION):
+    """Convert a points array of joined cubic bezier curves to an SVG path
+
+    points -- [A0, H00, H10, A1, H01, H11, ..., An], only the (x, y)
+              coordinates are used
+    closed -- Close the path at the end
+    precision -- Decimal places for each coordinate
+    """
+    points = numpy.asarray(points)
+    if points.shape[0] == 0:
+        return ""
+    num_curves = (points.shape[0] - 1) // 3
+    return path_template(num_curves, closed, precision) % tuple(
+        points[:3 * num_curves + 1, 0:2].ravel().tolist())
+
+
+def make_symbol(path):
+    """Create an aggdraw Symbol from an SVG path"""
+    return aggdraw.Symbol(path)
@@ -0,0 +1,164 @@
+import collections
+import json
+import os
+import threading
+import time
+
+import programation.helpers as helpers
+
+# The running Profiler, None when profiling is off
+ACTIVE = None
+
+
+class NullSpan(object):
+    """Span used when profiling is off, does nothing"""
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        return False
+
+
+NULL_SPAN = NullSpan()
+
+
+class Span(object):
+    """Times a block of code for a Profiler"""
+
+    __slots__ = ("profiler", "name", "category", "args", "start",
+                 "child_time")
+
+    def __init__(self, profiler, name, category, args):
+        self.profiler, self.name, self.category, self.args = \
+            profiler, name, category, args
+        self.start = self.child_time = 0.
+
+    def __enter__(self):
+        self.profiler.push(self)
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *args):
+        self.profiler.pop(self, time.perf_counter())
+        return False
+
+
+def span(name, category="stage", **args):
+    """Time a block of code if profiling is on
+
+    Usage:
+    with profiler.span("flush", "canvas"):
+        ...
+
+    name -- What is being timed
+    category -- Group of the span, ex: the shape class
+    args -- Extra values shown in the trace
+    """
+    if ACTIVE is None:
+        return NULL_SPAN
+    return Span(ACTIVE, name, category, args)
+
+
+def start():
+    """Turn profiling on, returning the new Profiler"""
+    global ACTIVE
+    ACTIVE = Profiler()
+    return ACTIVE
+
+
+def stop():
+    """Turn profiling off, returning the Profiler that was running"""
+    global ACTIVE
+    profiler, ACTIVE = ACTIVE, None
+    return profiler
+
+
+class Profiler(object):
+    """Collects timed spans, as a summary and as Chrome trace events
+
+    The trace can be opened in chrome://tracing or https://ui.perfetto.dev
+    """
+
+    CONFIG = {
+        "trace": True  # Keep every span for the Chrome trace
+    }
+
+    def __init__(self, **kwargs):
+        self.origin = time.perf_counter()
+        self.events = []
+        # [calls, total, self, max] time of each (category, name)
+        self.stats = collections.defaultdict(lambda: [0, 0., 0., 0.])
+        self.lock = threading.Lock()
+        # Open spans of each thread
+        self.local = threading.local()
+
+        helpers.handle_config(self, kwargs)
+
+    def stack(self):
+        """Open spans of the current thread"""
+        try:
+            return self.local.stack
+        except AttributeError:
+            self.local.stack = []
+            return self.local.stack
+
+    def push(self, span_):
+        self.stack().append(span_)
+
+    def pop(self, span_, end):
+        stack = self.stack()
+        stack.pop()
+        duration = end - span_.start
+        if stack:
+            stack[-1].child_time += duration
+        with self.lock:
+            stat = self.stats[(span_.category, span_.name)]
+            stat[0] += 1
+            stat[1] += duration
+            stat[2] += duration - span_.child_time
+            stat[3] = max(stat[3], duration)
+            if self.trace:
+                self.events.append((span_.name, span_.category,
+                                    span_.start, duration,
+                                    threading.get_ident(), span_.args))
+
+    def summary(self, limit=30):
+        """Table of the spans taking the most time, by self time"""
+        rows = sorted(self.stats.items(), key=lambda item: -item[1][2])
+        lines = ["{:<20} {:<20} {:>8} {:>10} {:>10} {:>9} {:>9}".format(
+            "category", "name", "calls", "total ms", "self ms", "mean ms",
+            "max ms")]
+        for (category, name), (calls, total, self_, max_) in rows[:limit]:
+            lines.append(
+                "{:<20} {:<20} {:>8} {:>10.2f} {:>10.2f} {:>9.3f} {:>9.3f}"
+                .format(category[:20], name[:20], calls, total * 1000.,
+                        self_ * 1000., total / calls * 1000., max_ * 1000.))
+        return "\n".join(lines)
+
+    def chrome_trace(self):
+        """Get the spans in the Chrome trace event format"""
+        pid = os.getpid()
+        with self.lock:
+            events = list(self.events)
+        return {
+            "traceEvents": [{
+                "name": name,
+                "cat": category,
+                "ph": "X",  # Complete event
+                "ts": (start - self.origin) * 1e6,
+                "dur": duration * 1e6,
+                "pid": pid,
+                "tid": tid,
+                "args": args
+            } for name, category, start, duration, tid, args in events],
+            "displayTimeUnit": "ms"
+        }
+
+    def save_trace(self, filename):
+        """Write the Chrome trace to a JSON file"""
+        filedir = os.path.dirname(os.path.abspath(filename))
+        if not os.path.isdir(filedir):
+            os.makedirs(filedir)
+        with open(filename, "w") as f:
+            json.dump(self.chrome_trace(), f)
@@ -1,19 +1,26 @@
 from copy import deepcopy
+import itertools
 
 from colour import Color
 
-import aggdraw
-import functools
-
 import programation.helpers as helpers
+import programation.profiler as profiler
+import programation.styles as styles
 import programation.transform as transform
 
+# Geometry states of shapes that don't describe what they draw, never
+# repeated so they always count as changed
+UNKNOWN_STATES = itertools.count()
+# Content state of those shapes, their frames can't be cached
+UNKNOWN_CONTENT = object()
+
 
 class Shape(object):
     """Defines default values for other shapes"""
 
     CONFIG = {
         "name": None,
+        # Converted to an insertion ordered {child: None} dict
         "children": [],
         "stroke_color": Color("white"),
         "stroke_width": 1.,
@@ -23,16 +30,24 @@ class Shape(object):
         "transform_": transform.Transform.IDENTITY(),
         "parent_transform": None,
         "global_transform": None,
+        "static": False,  # Cache the subtree as a layer, see Camera.render
     }
 
     def __init__(self, **kwargs):
-        self.brush = self.pen = None
+        self.brush = self.pen = self.parent = None
+        # Device space boxes, see update_boxes
+        self.box = self.subtree_box = None
+        # (geometry_state, box) of the last local_box, and
+        # (local box, transform, version, pad, box) of the last get_box
+        self.local_box_cache = self.box_cache = None
+        # (transform_, version, parent_transform, version) used to compute
+        # global_transform
+        self.transform_state = None
 
         helpers.handle_config(self, kwargs)
         if self.name is None:
             self.name = self.__class__.__name__
         self.validate_children()
-        self.update_transform()
         self.handle_colors()
 
     def __str__(self):
@@ -41,17 +56,34 @@ class Shape(object):
     def __repr__(self):
         return self.__str__()
 
+    def __getstate__(self):
+        # aggdraw objects can't be copied or pickled. The parent is left out
+        # so copying a subtree doesn't copy its ancestors, __setstate__
+        # links the children back
+        state = self.__dict__.copy()
+        state["pen"] = state["brush"] = state["parent"] = None
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__ = state
+        for child in self.children:
+            child.parent = self
+
     def copy(self):
         return deepcopy(self)
 
+    def ancestors(self):
+        """Iterate over the parent, grandparent, etc."""
+        ancestor = self.parent
+        while ancestor is not None:
+            yield ancestor
+            ancestor = ancestor.parent
+
     def has_loop(self, child):
-        """Return if there is a reference loop"""
-        if child == self:
+        """Return if adding the child would create a reference loop"""
+        if child is self:
             return True
-        for subchild in child.children:
-            if self.has_loop(subchild):
-                return True
-        return False
+        return any(ancestor is child for ancestor in self.ancestors())
 
     def validate_child(self, child):
         """Make sure the child is valid
@@ -66,25 +98,32 @@ class Shape(object):
 
     def validate_children(self):
         """Make sure the current children are valid"""
-        for child in self.children:
-            self.validate_child(child)
+        children = self.children
         # Remove duplicates
-        self.children = functools.reduce(lambda r, e: (r + [e]) if e not in r else r,
-                                         self.children, [])
+        self.children = dict()
+        self.add(*children)
 
     def add(self, *children):
-        """Validate and add new children uniquely"""
+        """Validate and add new children uniquely
+
+        A child can only have one parent, so it is moved if it already has
+        one
+        """
         for child in children:
             self.validate_child(child)
-            if child not in self.children:
-                self.children.append(child)
-        self.update_transform()
+            if child.parent is self:
+                continue
+            if child.parent is not None:
+                child.parent.remove(child)
+            self.children[child] = None
+            child.parent = self
 
     def remove(self, *children):
         """Remove a child shape if present"""
         for child in children:
-            if isinstance(child, Shape) and child in self.children:
-                self.children.remove(child)
+            if isinstance(child, Shape) and child.parent is self:
+                del self.children[child]
+                child.parent = None
 
     def flatten(self):
         """Return the entire shape tree as a single array"""
@@ -99,41 +138,186 @@ class Shape(object):
         self.fill_color = helpers.to_color(self.fill_color)
 
     def get_pen(self):
-        """Create a pen from stroke properties"""
+        """Get a (shared) pen from stroke properties"""
         # No stroke?
         if (self.stroke_color is None or self.stroke_width <= 0. or
                 self.stroke_alpha <= 0.):
             return None
-        return aggdraw.Pen(self.stroke_color.hex_l, width=self.stroke_width,
-                           opacity=int(255 * self.stroke_alpha))
+        return styles.get_pen(self.stroke_color, self.stroke_width,
+                              self.stroke_alpha)
 
     def get_brush(self):
-        """Create a brush from fill properties"""
+        """Get a (shared) brush from fill properties"""
         # No fill?
         if self.fill_color is None or self.fill_alpha <= 0.:
             return None
-        return aggdraw.Brush(self.fill_color.hex_l,
-                             opacity=int(255 * self.fill_alpha))
+        return styles.get_brush(self.fill_color, self.fill_alpha)
 
     def update_transform(self, parent_transform=False):
-        """Update and/or propogate parent transform
+        """Set the parent transform and/or mark the global transform as out
+        of date, it is recomputed by resolve_transforms
 
         parent_transform -- If provided (not default value of False),
                             store as instance parent_transform
         """
-        if parent_transform is False:
-            parent_transform = self.parent_transform
-        self.parent_transform = parent_transform
-        if self.transform_:
-            # pylint: disable=no-member
-            self.global_transform = self.transform_.copy()
+        if parent_transform is not False:
+            self.parent_transform = parent_transform
+        self.transform_state = None
+
+    def get_transform_state(self):
+        """Get what the global transform currently depends on"""
+        state = [None] * 4
+        for i, transform_ in enumerate([self.transform_,
+                                        self.parent_transform]):
+            if transform_:
+                state[2 * i:2 * i + 2] = transform_, transform_.version
+        return state
+
+    def is_transform_dirty(self):
+        """Return if the global transform needs to be recomputed"""
+        if self.transform_state is None or self.global_transform is None:
+            return True
+        old, new = self.transform_state, self.get_transform_state()
+        return (old[0] is not new[0] or old[1] != new[1] or
+                old[2] is not new[2] or old[3] != new[3])
+
+    def resolve_transforms(self):
+        """Recompute the out of date global transforms in the subtree"""
+        if self.is_transform_dirty():
+            # Reuse the same object so children see a new version
+            if self.global_transform is None:
+                self.global_transform = transform.Transform.IDENTITY()
+            self.global_transform.assign(self.transform_ or
+                                         transform.Transform.IDENTITY())
             if self.parent_transform:
                 self.global_transform.merge(self.parent_transform)
-        else:
-            self.global_transform = self.parent_transform.copy()
-        # Update children
+            self.transform_state = self.get_transform_state()
+        for child in self.children:
+            child.parent_transform = self.global_transform
+            child.resolve_transforms()
+
+    def geometry_state(self):
+        """Get the values that affect the shape's outline (for sub classes)
+
+        Shapes that draw without implementing this are treated as changed
+        every time
+        """
+        if type(self).draw_self is Shape.draw_self:
+            return None
+        return next(UNKNOWN_STATES)
+
+    def content_state(self):
+        """Get the values that affect the shape's outline, like
+        geometry_state but the same across runs and processes (for sub
+        classes)"""
+        if (type(self).geometry_state is Shape.geometry_state and
+                type(self).draw_self is not Shape.draw_self):
+            return UNKNOWN_CONTENT
+        return self.geometry_state()
+
+    def style_state(self):
+        """Get the colors, widths and transform the shape is drawn with"""
+        # get_hsl skips Color's slow attribute lookup
+        stroke, fill = self.stroke_color, self.fill_color
+        transform_ = self.global_transform
+        return (stroke.get_hsl() if stroke is not None else None,
+                self.stroke_width, self.stroke_alpha,
+                fill.get_hsl() if fill is not None else None, self.fill_alpha,
+                transform_.to_tuple() if transform_ is not None else None)
+
+    def draw_state(self):
+        """Get the values that affect how this shape, without children, is
+        drawn"""
+        return (self.__class__, self.geometry_state()) + self.style_state()
+
+    def fingerprint(self):
+        """Hash the drawn state of the subtree
+
+        Transforms must be resolved first, see resolve_transforms
+        """
+        # Children are hashed before their parents, without recursion so
+        # deep trees don't reach the recursion limit
+        order = [self]
+        for shape in order:
+            order.extend(shape.children)
+        hashes = {}
+        for shape in reversed(order):
+            hashes[shape] = hash((shape.draw_state(), tuple(
+                hashes.pop(child) for child in shape.children)))
+        return hashes[self]
+
+    def content_hash(self, digest):
+        """Feed the drawn state of the subtree to a hashlib object
+
+        Unlike fingerprint, the result is the same across runs. Transforms
+        must be resolved first, see resolve_transforms
+
+        Returns: False if a shape's content is unknown, and the hash can't
+                 be used
+        """
+        cls = self.__class__
+        digest.update(repr((cls.__module__, cls.__qualname__,
+                            len(self.children)) + self.style_state())
+                      .encode())
+        state = self.content_state()
+        if state is UNKNOWN_CONTENT:
+            return False
+        digest.update(state if isinstance(state, bytes)
+                      else repr(state).encode())
+        return all(child.content_hash(digest) for child in self.children)
+
+    def local_box(self):
+        """Compute the (x0, y0, x1, y1) box of what draw_self draws, before
+        any transform
+
+        Returns None if nothing is drawn, and helpers.UNBOUNDED_BOX if it
+        is unknown
+        """
+        if type(self).draw_self is Shape.draw_self:
+            return None
+        # Sub classes that draw should also implement this
+        return helpers.UNBOUNDED_BOX
+
+    def get_local_box(self):
+        """Get the local box, cached until the geometry changes"""
+        state = self.geometry_state()
+        if self.local_box_cache is None or \
+                self.local_box_cache[0] != state:
+            self.local_box_cache = (state, self.local_box())
+        return self.local_box_cache[1]
+
+    def get_box(self):
+        """Get the device space box of the shape (without children)
+
+        Transforms must be resolved first, see resolve_transforms
+        """
+        box = self.get_local_box()
+        if box is None:
+            return None
+        # Room for the stroke's width, joins and antialiasing
+        pad = 1. + 2. * max(self.stroke_width, 0.)
+        transform_ = self.global_transform
+        version = transform_.version if transform_ is not None else None
+        cache = self.box_cache
+        if cache is None or cache[0] is not box or \
+                cache[1] is not transform_ or cache[2] != version or \
+                cache[3] != pad:
+            cache = self.box_cache = (box, transform_, version, pad,
+                                      helpers.transform_box(transform_, box,
+                                                            pad))
+        return cache[4]
+
+    def update_boxes(self):
+        """Compute the device space boxes of the shape and its subtree
+
+        Returns: The subtree's box
+        """
+        self.box = self.get_box()
+        box = self.box
         for child in self.children:
-            child.update_transform(self.global_transform)
+            box = helpers.union_boxes(box, child.update_boxes())
+        self.subtree_box = box
+        return box
 
     def pre_draw(self, canvas):
         """Set up the transform and aggdraw objects"""
@@ -152,8 +336,20 @@ class Shape(object):
         pass
 
     def draw(self, canvas):
-        """Perform drawing events and draw children"""
-        self.pre_draw(canvas)
-        self.draw_self(canvas, self.pen, self.brush)
-        for child in self.children:
-            child.draw(canvas)
+        """Perform drawing events and draw children
+
+        Skips anything outside of the canvas, using the boxes from
+        update_boxes
+        """
+        if canvas.cull and not canvas.is_visible(self.subtree_box):
+            return
+        category = self.__class__.__name__
+        if not canvas.cull or canvas.is_visible(self.box):
+            with profiler.span("pre_draw", category):
+                self.pre_draw(canvas)
+            with profiler.span("draw_self", category):
+                self.draw_self(canvas, self.pen, self.brush)
+        if self.children:
+            with profiler.span("children", category):
+                for child in self.children:
+                    child.draw(canvas)
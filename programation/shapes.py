@@ -1,14 +1,17 @@
-import numpy
-
 import aggdraw
 
 import programation.helpers as helpers
+import programation.paths as paths
+import programation.profiler as profiler
 import programation.shape as shape
 
 
 class TestShape(shape.Shape):
     """Just has an example drawing"""
 
+    def local_box(self):
+        return (0., 0., helpers.DEF_WIDTH, helpers.DEF_HEIGHT)
+
     def draw_self(self, canvas, pen, brush):
         w, h = helpers.DEF_WIDTH, helpers.DEF_HEIGHT
         d = canvas.drawing
@@ -55,6 +58,12 @@ class BoundedShape(shape.Shape):
         helpers.handle_config(self, kwargs)
         shape.Shape.__init__(self, **kwargs)
 
+    def geometry_state(self):
+        return self.bounds.tobytes()
+
+    def local_box(self):
+        return helpers.points_box(self.bounds.reshape(2, 2))
+
 
 class Line(BoundedShape):
     """Simple line"""
@@ -79,6 +88,10 @@ class SliceShape(BoundedShape):
         helpers.handle_config(self, kwargs, locals())
         BoundedShape.__init__(self, bounds, **kwargs)
 
+    def geometry_state(self):
+        return (BoundedShape.geometry_state(self), self.start_angle,
+                self.end_angle)
+
 
 class Arc(SliceShape):
     """Simple arc"""
@@ -109,21 +122,43 @@ class Symbol(shape.Shape):
     def __init__(self, path, **kwargs):
         assert isinstance(path, str), "Path must be a string"
         self.path = path
+        # Path the symbol was built from
+        self.symbol_path = None
 
         helpers.handle_config(self, kwargs)
         self.update_symbol()
         shape.Shape.__init__(self, **kwargs)
 
+    def __getstate__(self):
+        state = shape.Shape.__getstate__(self)
+        del state["symbol"]
+        return state
+
+    def __setstate__(self, state):
+        shape.Shape.__setstate__(self, state)
+        self.update_symbol()
+
     def draw_self(self, canvas, pen, brush):
         canvas.drawing.symbol((0, 0), self.symbol, pen, brush)
 
+    def geometry_state(self):
+        return self.symbol_path
+
+    def local_box(self):
+        points = paths.path_coordinates(self.path_string())
+        if points is None:
+            return helpers.UNBOUNDED_BOX
+        return helpers.points_box(points)
+
     def path_string(self):
         """Return the shape as an SVG path string"""
         return self.path
 
     def update_symbol(self):
         """Update the internal aggdraw Symbol object"""
-        self.symbol = aggdraw.Symbol(self.path_string())
+        with profiler.span("paths", self.__class__.__name__):
+            self.symbol_path = self.path_string()
+            self.symbol = paths.make_symbol(self.symbol_path)
 
 
 class BezierCurve(Symbol):
@@ -146,11 +181,16 @@ class BezierCurve(Symbol):
         if self.slice_pos != 0.:
             Symbol.draw_self(self, canvas, pen, brush)
 
+    def geometry_state(self):
+        return (self.symbol_path, self.slice_pos != 0.)
+
+    def local_box(self):
+        if self.slice_pos == 0.:
+            return None
+        return helpers.bezier_box(self.drawn[None])
+
     def path_string(self):
-        path = "M {} {} C {} {}, {} {}, {} {}".format(*self.drawn.flatten())
-        if self.close_path:
-            path += " Z"
-        return path
+        return paths.bezier_path(self.drawn, self.close_path)
 
     def update_symbol(self):
         self.drawn = helpers.split_bezier(self.anchors, 0, self.slice_pos)
@@ -181,20 +221,19 @@ class Polyline(Symbol):
     def path_string(self):
         if self.handles is None:
             return ""
-        path = "M {} {}".format(self.points[0, 0], self.points[0, 1])
-        for i in range(self.handles.shape[1]):
-            triplet = numpy.array([self.handles[0, i, :],
-                                   self.handles[1, i, :],
-                                   self.points[i + 1, :]])
-            path += " C {} {}, {} {}, {} {}".format(*triplet.flatten())
-        if helpers.is_path_closed(self.points):
-            path += " Z"
-        return path
+        return paths.bezier_path(paths.join_points(self.points, *self.handles),
+                                 helpers.is_path_closed(self.points))
 
     def update_symbol(self):
         self.create_handles()
         Symbol.update_symbol(self)
 
+    def local_box(self):
+        if self.handles is None:
+            return None
+        return helpers.bezier_box(paths.split_curves(
+            paths.join_points(self.points, *self.handles)))
+
     def create_handles(self):
         if self.smooth:
             self.handles = helpers.get_smooth_handles(self.points)
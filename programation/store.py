@@ -0,0 +1,130 @@
+import json
+import os
+import tempfile
+
+import numpy
+
+import programation.helpers as helpers
+
+
+class FrameStore(object):
+    """Frames kept on disk in a single memory mapped file
+
+    Acts like a list of (height, width, 4) uint8 frames. Reading a frame
+    returns a zero-copy view of the file. Frames appended twice in a row
+    are stored once.
+
+    Files:
+    <path> -- The frame data
+    <path>.json -- Frame dimensions
+    <path>.index -- Data slot of each frame, as int64
+
+    Without a path, the files are temporary and deleted by close.
+    """
+
+    CONFIG = {
+        "chunk": 32  # Number of frames to grow the data file by
+    }
+
+    def __init__(self, path, width, height, **kwargs):
+        helpers.handle_config(self, kwargs, dict(path=path, width=width,
+                                                 height=height))
+        self.temporary = self.path is None
+        if self.temporary:
+            handle, self.path = tempfile.mkstemp(suffix=".frames")
+            os.close(handle)
+        filedir = os.path.dirname(os.path.abspath(self.path))
+        if not os.path.isdir(filedir):
+            os.makedirs(filedir)
+        with open(self.path + ".json", "w") as f:
+            json.dump(dict(width=self.width, height=self.height), f)
+        # Start empty
+        open(self.path, "wb").close()
+        open(self.path + ".index", "wb").close()
+        self.setup(numpy.zeros(0, dtype=numpy.int64), 0)
+
+    @staticmethod
+    def open(path, **kwargs):
+        """Reopen an existing store"""
+        with open(path + ".json") as f:
+            meta = json.load(f)
+        store = FrameStore.__new__(FrameStore)
+        helpers.handle_config(store, kwargs, dict(path=path, **meta))
+        store.temporary = False
+        index = numpy.fromfile(path + ".index", dtype=numpy.int64)
+        slots = int(index.max()) + 1 if len(index) else 0
+        store.setup(index, slots)
+        return store
+
+    def setup(self, index, slots):
+        """Map the files, given the current index and used slots"""
+        self.index = list(index.tolist())
+        self.slots = slots
+        self.last_frame = None
+        self.index_file = open(self.path + ".index", "ab", buffering=0)
+        self.data = None
+        self.capacity = 0
+        self.map(max(slots, os.path.getsize(self.path) // self.frame_size()))
+
+    def __len__(self):
+        return len(self.index)
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return [self[j] for j in range(*i.indices(len(self)))]
+        return self.data[self.index[i]]
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self[i]
+
+    def frame_size(self):
+        return self.width * self.height * 4
+
+    def map(self, capacity):
+        """Grow the data file and map it, views of the old map stay valid"""
+        if capacity == 0:
+            self.data = helpers.empty_frame(self.width, self.height)[None][:0]
+            return
+        if os.path.getsize(self.path) < capacity * self.frame_size():
+            with open(self.path, "r+b") as f:
+                f.truncate(capacity * self.frame_size())
+        self.data = numpy.memmap(self.path, dtype=numpy.uint8, mode="r+",
+                                 shape=(capacity, self.height, self.width,
+                                        4))
+        self.capacity = capacity
+
+    def append(self, frame):
+        """Write a frame into the mapped file"""
+        if frame is self.last_frame:
+            slot = self.index[-1]
+        else:
+            assert frame.shape == (self.height, self.width, 4), \
+                "Frame does not match the store dimensions"
+            if self.slots >= self.capacity:
+                self.map(self.capacity + self.chunk)
+            slot = self.slots
+            self.data[slot] = frame
+            self.slots += 1
+            self.last_frame = frame
+        self.index.append(slot)
+        self.index_file.write(numpy.int64(slot).tobytes())
+
+    def flush(self):
+        """Make sure everything is written to disk"""
+        if isinstance(self.data, numpy.memmap):
+            self.data.flush()
+
+    def close(self):
+        """Close the files, deleting them if temporary"""
+        self.flush()
+        self.index_file.close()
+        if self.temporary:
+            # Frames already read stay valid, they keep their own map open
+            self.data = None
+            for path in [self.path, self.path + ".json",
+                         self.path + ".index"]:
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
@@ -0,0 +1,447 @@
+import collections
+import concurrent.futures
+import os
+import queue
+import shutil
+import stat
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+import numpy
+
+import programation.helpers as helpers
+import programation.profiler as profiler
+
+QUALITIES = ("draft", "review", "final")
+# Video format of each file extension, images are saved as a sequence
+VIDEO_FORMATS = {".mp4": "mp4", ".webm": "webm", ".gif": "gif",
+                 ".y4m": "y4m", ".raw": "raw"}
+IMAGE_FORMATS = (".png", ".webp")
+# Video formats that can be encoded in segments and joined without
+# re-encoding
+SEGMENT_FORMATS = ("mp4", "webm")
+# Filename to write video to standard output
+STDOUT = "-"
+
+
+def open_stream(filename, width, height, **kwargs):
+    """Create the stream for a file, chosen by its extension
+
+    Image files need a frame number pattern, ex: ./frames/%04d.png
+    """
+    if os.path.splitext(filename)[1].lower() in IMAGE_FORMATS:
+        return ImageSequence(filename, width, height, **kwargs)
+    return VideoStream(filename, width, height, **kwargs)
+
+
+def encoder_args(format_, quality):
+    """FFmpeg output arguments for a video format and quality"""
+    level = QUALITIES.index(quality)
+    if format_ == "mp4":
+        return ["-vcodec", "libx264", "-pix_fmt", "yuv420p",
+                "-preset", ("ultrafast", "veryfast", "medium")[level],
+                "-crf", ("28", "23", "17")[level]]
+    if format_ == "webm":
+        return ["-vcodec", "libvpx-vp9", "-pix_fmt", "yuv420p", "-b:v", "0",
+                "-crf", ("40", "33", "24")[level],
+                "-deadline", ("realtime", "good", "good")[level],
+                "-cpu-used", ("8", "4", "1")[level], "-row-mt", "1"]
+    if format_ == "gif":
+        # Generate a palette from all frames, then map the frames onto it
+        return ["-filter_complex",
+                "split[a][b];[a]palettegen=max_colors={}[p];"
+                "[b][p]paletteuse=dither={}".format(
+                    (64, 128, 256)[level],
+                    ("none", "bayer", "sierra2_4a")[level]),
+                "-loop", "0"]
+    if format_ == "y4m":
+        return ["-pix_fmt", "yuv420p", "-f", "yuv4mpegpipe"]
+    return ["-vcodec", "rawvideo", "-pix_fmt", "rgba", "-f", "rawvideo"]
+
+
+def can_segment(filename, count, segments):
+    """Return if count frames can be encoded to a file in segments"""
+    return (segments > 1 and count >= 2 * segments and
+            VIDEO_FORMATS.get(os.path.splitext(filename)[1].lower()) in
+            SEGMENT_FORMATS)
+
+
+def write_segments(frames, filename, width, height, segments, **kwargs):
+    """Encode contiguous segments of the frames at the same time, with one
+    FFmpeg process each, then join them without re-encoding
+
+    frames -- Sequence of frames
+    segments -- Number of segments/FFmpeg processes
+    kwargs -- VideoStream config
+    """
+    assert can_segment(filename, len(frames), segments), \
+        "Can't encode {} frames to '{}' in {} segments".format(
+            len(frames), filename, segments)
+    start_time = time.monotonic()
+    absfile = os.path.abspath(filename)
+    filedir = os.path.dirname(absfile)
+    if not os.path.isdir(filedir):
+        os.makedirs(filedir)
+    workdir = tempfile.mkdtemp(dir=filedir)
+    ext = os.path.splitext(filename)[1]
+    paths = [os.path.join(workdir, "{}{}".format(i, ext))
+             for i in range(segments)]
+    bounds = [len(frames) * i // segments for i in range(segments + 1)]
+    try:
+        with concurrent.futures.ThreadPoolExecutor(
+                max_workers=segments) as executor:
+            futures = [executor.submit(write_segment,
+                                       frames[bounds[i]:bounds[i + 1]],
+                                       paths[i], width, height, kwargs)
+                       for i in range(segments)]
+            for future in futures:
+                future.result()
+        joined = os.path.join(workdir, "joined" + ext)
+        concat_videos(paths, joined)
+        shutil.move(joined, absfile)
+    finally:
+        shutil.rmtree(workdir)
+    print(throughput("Encoded", len(frames), start_time) +
+          " in {} segments".format(segments))
+    print(f"Saved to '{filename}' successfully")
+
+
+def write_segment(frames, filename, width, height, config):
+    """Encode one segment, run by a thread of write_segments"""
+    video = VideoStream(filename, width, height, verbose=False, **config)
+    for frame in frames:
+        video.write(frame)
+    video.close()
+
+
+def concat_videos(paths, filename):
+    """Join videos with the same encoding using FFmpeg's concat demuxer"""
+    listfile = filename + ".txt"
+    with open(listfile, "w") as f:
+        for path in paths:
+            f.write("file '{}'\n".format(path.replace("'", "'\\''")))
+    command = [
+        helpers.FFMPEG_BIN,
+        "-y",  # Overwrite
+        "-f", "concat",
+        "-safe", "0",  # Allow absolute paths
+        "-i", listfile,
+        "-c", "copy",  # No re-encoding
+        "-loglevel", "error",
+        filename
+    ]
+    result = subprocess.run(command, stderr=subprocess.PIPE)
+    os.remove(listfile)
+    if result.returncode != 0:
+        raise IOError("FFmpeg failed: " +
+                      result.stderr.decode(errors="replace").strip())
+
+
+def throughput(action, count, start_time):
+    """Describe how fast frames were handled"""
+    elapsed = time.monotonic() - (start_time or time.monotonic())
+    return "{} {} frames in {:.2f}s ({:.1f} fps)".format(
+        action, count, elapsed, count / elapsed if elapsed else 0.)
+
+
+class VideoStream(object):
+    """Encodes frames with FFmpeg as soon as they are written
+
+    Frames are handed to a writer thread through a bounded queue without
+    being copied, so they must not be modified after being written. FFmpeg's
+    error output is read by another thread so it can't fill up and block.
+
+    The format comes from the file extension (see VIDEO_FORMATS). Video can
+    also be written to a named pipe, or to standard output with STDOUT as
+    the filename, in which case messages are printed to standard error.
+
+    Source:
+    http://zulko.github.io/blog/2013/09/27/
+        read-and-write-video-frames-in-python-using-ffmpeg/
+    """
+
+    CONFIG = {
+        "fps": helpers.DEF_FPS,
+        "reverse": False,  # Append the frames again in reverse on close
+        "queue_size": 8,  # Number of frames waiting to be encoded
+        "quality": "final",  # Possible values: draft, review, final
+        "format": None,  # Video format, from the extension if None
+        "verbose": True  # Print progress messages
+    }
+
+    def __init__(self, filename, width, height, **kwargs):
+        helpers.handle_config(self, kwargs, dict(filename=filename,
+                                                 width=width, height=height))
+        assert isinstance(self.filename, str), \
+            "You must supply a valid filename"
+        if self.format is None:
+            self.format = "y4m" if self.filename == STDOUT else \
+                VIDEO_FORMATS.get(os.path.splitext(self.filename)[1].lower())
+        assert self.format in VIDEO_FORMATS.values(), \
+            "Can only save to: " + ", ".join(VIDEO_FORMATS)
+        assert self.filename != STDOUT or self.format in ("y4m", "raw"), \
+            "Can only write y4m or raw video to stdout"
+        assert self.quality in QUALITIES, \
+            "Quality must be one of: " + ", ".join(QUALITIES)
+        assert isinstance(self.fps, int), "FPS can only be an integer"
+        assert self.fps > 0, "FPS must be positive"
+        # Frames written, and frames sent to FFmpeg
+        self.count = self.sent = 0
+        self.start_time = None
+        # Spool offset of each frame, repeated frames share an offset
+        self.offsets = []
+        self.last_frame = None
+        # Regular files are written to a temporary file first
+        self.tempfile = None
+        if self.filename == STDOUT:
+            self.output = "pipe:1"
+        elif (os.path.exists(self.filename) and
+                stat.S_ISFIFO(os.stat(self.filename).st_mode)):
+            self.output = self.filename
+        else:
+            self.absfile = os.path.abspath(self.filename)
+            abspre, absext = os.path.splitext(self.absfile)
+            self.output = self.tempfile = abspre + ".temp" + absext
+            filedir = os.path.dirname(self.absfile)
+            if not os.path.isdir(filedir):
+                os.makedirs(filedir)
+        # Frames are spooled to disk so they can be replayed in reverse
+        # without being kept in memory
+        self.spool = tempfile.TemporaryFile() if self.reverse else None
+        self.pipe = self.open_pipe()
+        self.errors = []
+        self.error_output = b""
+        self.queue = queue.Queue(maxsize=self.queue_size)
+        self.writer = threading.Thread(target=self.write_frames, daemon=True)
+        self.reader = threading.Thread(target=self.read_errors, daemon=True)
+        self.writer.start()
+        self.reader.start()
+
+    def command(self):
+        """Build the FFmpeg command line"""
+        return [
+            helpers.FFMPEG_BIN,
+            "-y",  # Overwrite
+            "-f", "rawvideo",
+            "-vcodec", "rawvideo",
+            "-s", "{}x{}".format(self.width, self.height),
+            "-pix_fmt", "rgba",
+            "-r", str(self.fps),
+            "-i", "-",  # From pipe
+            "-an",  # No audio
+            *encoder_args(self.format, self.quality),
+            "-loglevel", "error",
+            self.output
+        ]
+
+    def open_pipe(self):
+        """Start the FFmpeg process"""
+        command = self.command()
+        pipe = subprocess.Popen(command, stdin=subprocess.PIPE,
+                                stderr=subprocess.PIPE)
+        if pipe is None:
+            raise IOError("Could not start FFMPEG with given parameters: " +
+                          " ".join(command))
+        return pipe
+
+    def frame_size(self):
+        """Number of bytes in a single RGBA frame"""
+        return self.width * self.height * 4
+
+    def send(self, data):
+        """Write raw frame bytes to FFmpeg"""
+        self.pipe.stdin.write(data)
+        self.sent += 1
+
+    def write(self, frame):
+        """Queue a single frame for encoding, waiting if the queue is full"""
+        if self.errors:
+            # FFmpeg stopped, wait for all of its error output
+            self.pipe.wait()
+            self.reader.join()
+            raise self.failure()
+        data = numpy.ascontiguousarray(frame, dtype=numpy.uint8)
+        assert data.nbytes == self.frame_size(), \
+            "Frame does not match the stream dimensions"
+        if self.start_time is None:
+            self.start_time = time.monotonic()
+        self.queue.put((memoryview(data).cast("B"),
+                        frame is self.last_frame))
+        self.last_frame = frame
+        self.count += 1
+
+    def write_frames(self):
+        """Send queued frames to FFmpeg, run by the writer thread"""
+        while True:
+            item = self.queue.get()
+            if item is None:
+                return
+            if self.errors:
+                # Keep emptying the queue so write() can't block
+                continue
+            data, repeated = item
+            try:
+                with profiler.span("send", "stream"):
+                    self.send(data)
+                if self.spool is not None:
+                    if repeated:
+                        self.offsets.append(self.offsets[-1])
+                    else:
+                        self.offsets.append(self.spool.tell())
+                        self.spool.write(data)
+            except IOError as e:
+                self.errors.append(e)
+
+    def read_errors(self):
+        """Collect FFmpeg's error output, run by the reader thread"""
+        self.error_output = self.pipe.stderr.read()
+
+    def failure(self):
+        """Create the error for a failed encode"""
+        return IOError("FFmpeg failed: " +
+                       self.error_output.decode(errors="replace").strip())
+
+    def log(self, message):
+        """Print a message, keeping standard output clean if writing to it"""
+        if not self.verbose:
+            return
+        if self.filename == STDOUT:
+            print(message, file=sys.stderr)
+        else:
+            print(message)
+
+    def write_reversed(self):
+        """Replay the spooled frames backwards"""
+        size = self.frame_size()
+        for offset in reversed(self.offsets):
+            self.spool.seek(offset)
+            self.send(self.spool.read(size))
+
+    def close(self):
+        """Finish encoding and move the video into place"""
+        self.queue.put(None)
+        self.writer.join()
+        if self.spool is not None:
+            if not self.errors:
+                try:
+                    self.write_reversed()
+                except IOError as e:
+                    self.errors.append(e)
+            self.spool.close()
+            self.spool = None
+        try:
+            self.pipe.stdin.close()
+        except IOError as e:
+            self.errors.append(e)
+        self.pipe.wait()
+        self.reader.join()
+        self.pipe.stderr.close()
+        if self.errors or self.pipe.returncode != 0:
+            raise self.failure()
+        self.log(throughput("Encoded", self.sent, self.start_time))
+        if self.tempfile is not None:
+            self.log("Renaming temporary file")
+            shutil.move(self.tempfile, self.absfile)
+        self.log(f"Saved to '{self.filename}' successfully")
+
+
+class ImageSequence(object):
+    """Saves frames as numbered PNG or WebP images, compressed in parallel
+
+    Has the same interface as VideoStream. Frames are compressed by a thread
+    pool, so they must not be modified after being written.
+    """
+
+    CONFIG = {
+        "fps": helpers.DEF_FPS,  # Unused, images have no frame rate
+        "reverse": False,  # Append the frames again in reverse on close
+        "quality": "final",  # Possible values: draft, review, final
+        "start": 0,  # Number of the first image
+        "workers": None  # Number of compressing threads, None for per CPU
+    }
+
+    def __init__(self, filename, width, height, **kwargs):
+        helpers.handle_config(self, kwargs, dict(filename=filename,
+                                                 width=width, height=height))
+        assert isinstance(self.filename, str), \
+            "You must supply a valid filename"
+        assert os.path.splitext(self.filename)[1].lower() in IMAGE_FORMATS, \
+            "Can only save images as: " + ", ".join(IMAGE_FORMATS)
+        assert "%" in self.filename, \
+            "Filename needs a frame number pattern, ex: %04d"
+        assert self.quality in QUALITIES, \
+            "Quality must be one of: " + ", ".join(QUALITIES)
+        if self.workers is None:
+            self.workers = os.cpu_count() or 1
+        filedir = os.path.dirname(os.path.abspath(self.filename))
+        if not os.path.isdir(filedir):
+            os.makedirs(filedir)
+        self.count = 0
+        self.start_time = None
+        self.last_frame = None
+        self.executor = concurrent.futures.ThreadPoolExecutor(
+            max_workers=self.workers)
+        self.pending = collections.deque()
+
+    def save_options(self):
+        """PIL save arguments for the format and quality"""
+        level = QUALITIES.index(self.quality)
+        if self.filename.lower().endswith(".png"):
+            return dict(compress_level=(1, 3, 6)[level])
+        return [dict(quality=70, method=0), dict(quality=85, method=2),
+                dict(lossless=True, quality=80, method=4)][level]
+
+    def path(self, i):
+        """Filename of image i"""
+        return self.filename % (self.start + i)
+
+    def save(self, data, path):
+        """Compress one frame, run by the thread pool"""
+        with profiler.span("save", "stream"):
+            helpers.image_from_array(data).save(path, **self.save_options())
+
+    def copy(self, previous, source, path):
+        """Copy an image once it's saved, run by the thread pool"""
+        previous.result()
+        shutil.copyfile(source, path)
+
+    def submit(self, func, *args):
+        """Run a task in the pool, waiting if too many are in flight"""
+        self.pending.append(self.executor.submit(func, *args))
+        while len(self.pending) > 2 * self.workers:
+            self.pending.popleft().result()
+
+    def write(self, frame):
+        """Queue a single frame for saving"""
+        if self.start_time is None:
+            self.start_time = time.monotonic()
+        if frame is self.last_frame:
+            # Copying the previous image is cheaper than compressing again
+            self.submit(self.copy, self.pending[-1], self.path(self.count - 1),
+                        self.path(self.count))
+        else:
+            data = numpy.ascontiguousarray(frame, dtype=numpy.uint8)
+            assert data.shape == (self.height, self.width, 4), \
+                "Frame does not match the stream dimensions"
+            self.submit(self.save, data, self.path(self.count))
+        self.last_frame = frame
+        self.count += 1
+
+    def close(self):
+        """Finish saving, appending the images in reverse if needed"""
+        while self.pending:
+            self.pending.popleft().result()
+        if self.reverse:
+            count = self.count
+            for i in reversed(range(count)):
+                self.submit(shutil.copyfile, self.path(i),
+                            self.path(self.count))
+                self.count += 1
+            while self.pending:
+                self.pending.popleft().result()
+        self.executor.shutdown()
+        print(throughput("Saved", self.count, self.start_time))
+        print(f"Saved to '{self.filename}' successfully")
@@ -0,0 +1,27 @@
+import aggdraw
+
+import programation.helpers as helpers
+
+# Shared by every shape in the process, shapes with the same style reuse
+# the same aggdraw objects
+PENS = helpers.LRUCache()
+BRUSHES = helpers.LRUCache()
+
+
+def get_pen(color, width, alpha):
+    """Get a cached pen for the stroke style"""
+    opacity = int(255 * alpha)
+    return PENS.get((color.hsl, width, opacity), lambda: aggdraw.Pen(
+        color.hex_l, width=width, opacity=opacity))
+
+
+def get_brush(color, alpha):
+    """Get a cached brush for the fill style"""
+    opacity = int(255 * alpha)
+    return BRUSHES.get((color.hsl, opacity), lambda: aggdraw.Brush(
+        color.hex_l, opacity=opacity))
+
+
+def cache_stats():
+    """Return the (hits, misses, size) of the pen and brush caches"""
+    return dict(pens=PENS.stats(), brushes=BRUSHES.stats())
@@ -1,4 +1,4 @@
-from copy import deepcopy
+import math
 
 import numpy
 
@@ -16,16 +16,23 @@ class Transform(object):
     y1 = d * x0 + e * y0 + f
     """
 
+    __slots__ = ("a", "b", "c", "d", "e", "f", "version")
+
     def __init__(self, a, b, c, d, e, f):
-        # Ensure proper arguments
+        self.a, self.b, self.c, self.d, self.e, self.f = a, b, c, d, e, f
+        # Incremented on every change, so dependents can tell when to update
+        self.version = 0
+
+    @staticmethod
+    def validated(a, b, c, d, e, f):
+        """Create a transformation, ensuring proper arguments"""
         for v in [a, b, c, d, e, f]:
             assert helpers.is_number(v), "Parameters must be numbers"
-        # Setup matrix
-        self.matrix = numpy.array([[a, b, c], [d, e, f], [0., 0., 1.]])
+        return Transform(*map(float, [a, b, c, d, e, f]))
 
     def __str__(self):
         return "{{Transform: [{}, {}, {}, {}, {}, {}]}}".format(
-            *self.to_array())
+            *self.to_tuple())
 
     def __repr__(self):
         return self.__str__()
@@ -33,42 +40,117 @@ class Transform(object):
     def __eq__(self, other):
         if not isinstance(other, Transform):
             return False
-        return self.matrix == other.matrix
+        return self.to_tuple() == other.to_tuple()
 
     def __ne__(self, other):
         return not self.__eq__(other)
 
     def copy(self):
-        return deepcopy(self)
+        return Transform(self.a, self.b, self.c, self.d, self.e, self.f)
 
-    def to_array(self):
+    @property
+    def matrix(self):
+        """The full 3x3 matrix"""
+        return numpy.array([[self.a, self.b, self.c], [self.d, self.e, self.f],
+                            [0., 0., 1.]])
+
+    @matrix.setter
+    def matrix(self, matrix):
+        (self.a, self.b, self.c), (self.d, self.e, self.f) = \
+            numpy.asarray(matrix)[0:2].tolist()
+        self.version += 1
+
+    def to_tuple(self):
         """Get in a form usable by aggdraw
 
         Returns: (a, b, c, d, e, f)
         """
-        return self.matrix.flatten()[0:6]
+        return self.a, self.b, self.c, self.d, self.e, self.f
+
+    def to_array(self):
+        """Get as an array of (a, b, c, d, e, f)"""
+        return numpy.array(self.to_tuple())
 
     def apply(self, x, y):
         """Apply the matrix to a point"""
-        point = self.matrix.dot(numpy.array([[x], [y], [1]]))
-        return (point[0], point[1])
+        return (self.a * x + self.b * y + self.c,
+                self.d * x + self.e * y + self.f)
+
+    def apply_points(self, points, in_place=False):
+        """Apply the matrix to an (N, dim) array of points at once
+
+        Only the (x, y) coordinates are transformed, any other dimensions
+        are left as is
+
+        in_place -- Overwrite the given float array instead of copying it
+        """
+        if in_place:
+            assert isinstance(points, numpy.ndarray) and \
+                points.dtype.kind == "f", \
+                "Can only transform a float array in place"
+            result = points
+        else:
+            result = numpy.array(points, dtype=float)
+        linear = numpy.array([[self.a, self.d], [self.b, self.e]])
+        result[..., 0:2] = (result[..., 0:2] @ linear +
+                            numpy.array([self.c, self.f]))
+        return result
+
+    def set(self, a, b, c, d, e, f):
+        """Replace all values"""
+        self.a, self.b, self.c, self.d, self.e, self.f = a, b, c, d, e, f
+        self.version += 1
+        return self
+
+    def assign(self, other):
+        """Copy another transformation's values into this one"""
+        return self.set(*other.to_tuple())
+
+    @staticmethod
+    def compose(left, right):
+        """Get the values of left * right"""
+        la, lb, ld, le = left.a, left.b, left.d, left.e
+        ra, rb, rc, rd, re, rf = (right.a, right.b, right.c, right.d,
+                                  right.e, right.f)
+        return (la * ra + lb * rd, la * rb + lb * re,
+                la * rc + lb * rf + left.c, ld * ra + le * rd,
+                ld * rb + le * re, ld * rc + le * rf + left.f)
 
     def combine(self, other):
         """Combine two transformations (self on left)"""
-        self.matrix = self.matrix.dot(other.matrix)
+        (self.a, self.b, self.c, self.d, self.e,
+         self.f) = Transform.compose(self, other)
+        self.version += 1
         return self
 
     def merge(self, other):
         """Combine two transformations (self on right)"""
-        self.matrix = other.matrix.dot(self.matrix)
+        (self.a, self.b, self.c, self.d, self.e,
+         self.f) = Transform.compose(other, self)
+        self.version += 1
         return self
 
+    def inverse(self):
+        """Create the inverse transformation"""
+        a, b, c, d, e, f = self.to_tuple()
+        det = a * e - b * d
+        if det == 0.:
+            raise ValueError("Transform is not invertible")
+        return Transform(e / det, -b / det, (b * f - c * e) / det,
+                         -d / det, a / det, (c * d - a * f) / det)
+
+    def invert(self):
+        """Invert the transformation in place"""
+        return self.assign(self.inverse())
+
     def __mul__(self, other):
         """Apply the transformation to another transformation/point"""
         if isinstance(other, Transform):
-            return Transform(*self.matrix.dot(other.matrix).flatten()[0:6])
+            return Transform(*Transform.compose(self, other))
         if isinstance(other, numpy.ndarray) and other.shape == (2,):
-            return self.matrix.dot(numpy.append(other, [1]))[0:2]
+            return numpy.array(self.apply(*other))
+        if isinstance(other, numpy.ndarray) and other.ndim == 2:
+            return self.apply_points(other)
         if isinstance(other, tuple) and len(other) == 2:
             return self.apply(*other)
         raise TypeError("Unsupported type")
@@ -76,31 +158,30 @@ class Transform(object):
     @staticmethod
     def IDENTITY():
         """Create an Identity transformation"""
-        return Transform(1, 0, 0, 0, 1, 0)
+        return Transform(1., 0., 0., 0., 1., 0.)
 
     @staticmethod
     def SHIFT(dx, dy):
         """Create a basic Shift transformation"""
-        return Transform(1, 0, dx, 0, 1, dy)
+        return Transform(1., 0., dx, 0., 1., dy)
 
     def set_shift(self, dx, dy):
-        self.matrix[0:2, 2] = numpy.array([dx, dy])
+        self.c, self.f = dx, dy
+        self.version += 1
         return self
 
     def shift(self, ddx, ddy):
-        self.matrix[0:2, 2] += numpy.array([ddx, ddy])
+        self.c += ddx
+        self.f += ddy
+        self.version += 1
         return self
 
     @staticmethod
     def SKEW_ABOUT(xcenter, ycenter, a, b, c, d):
         """Create a Skew transformation"""
-        offset = numpy.array([[0], [0]])
-        if xcenter != 0. or ycenter != 0.:
-            # Compute the offset for unshift->transform->shift
-            center = numpy.array([[xcenter], [ycenter]])
-            offset = (numpy.identity(2, dtype=float)
-                      - numpy.array([[a, b], [c, d]])).dot(center)
-        return Transform(a, b, offset[0, 0], c, d, offset[1, 0])
+        # Compute the offset for unshift->transform->shift
+        return Transform(a, b, (1. - a) * xcenter - b * ycenter,
+                         c, d, (1. - d) * ycenter - c * xcenter)
 
     def skew_about(self, xcenter, ycenter, a, b, c, d):
         return self.merge(Transform.SKEW_ABOUT(xcenter, ycenter, a, b, c, d))
@@ -108,10 +189,11 @@ class Transform(object):
     @staticmethod
     def SKEW(a, b, c, d):
         """Create a basic Skew transformation"""
-        return Transform.SKEW_ABOUT(0, 0, a, b, c, d)
+        return Transform(a, b, 0., c, d, 0.)
 
     def set_skew(self, a, b, c, d):
-        self.matrix[0:2, 0:2] = numpy.array([[a, b], [c, d]])
+        self.a, self.b, self.d, self.e = a, b, c, d
+        self.version += 1
         return self
 
     def skew(self, a, b, c, d):
@@ -120,7 +202,7 @@ class Transform(object):
     @staticmethod
     def RESIZE_ABOUT(xcenter, ycenter, xscalar, yscalar):
         """Create a Resize transformation"""
-        return Transform.SKEW_ABOUT(xcenter, ycenter, xscalar, 0, 0, yscalar)
+        return Transform.SKEW_ABOUT(xcenter, ycenter, xscalar, 0., 0., yscalar)
 
     def resize_about(self, xcenter, ycenter, xscalar, yscalar):
         return self.merge(Transform.RESIZE_ABOUT(xcenter, ycenter, xscalar,
@@ -129,13 +211,13 @@ class Transform(object):
     @staticmethod
     def RESIZE(xscalar, yscalar):
         """Create a basic Resize transformation"""
-        return Transform.RESIZE_ABOUT(0, 0, xscalar, yscalar)
+        return Transform.SKEW(xscalar, 0., 0., yscalar)
 
     def set_resize(self, xscalar, yscalar):
-        return self.set_skew(xscalar, 0, 0, yscalar)
+        return self.set_skew(xscalar, 0., 0., yscalar)
 
     def resize(self, xscalar, yscalar):
-        return self.skew(xscalar, 0, 0, yscalar)
+        return self.skew(xscalar, 0., 0., yscalar)
 
     @staticmethod
     def SCALE_ABOUT(xcenter, ycenter, scalar):
@@ -148,7 +230,7 @@ class Transform(object):
     @staticmethod
     def SCALE(scalar):
         """Create a basic Scale transformation"""
-        return Transform.SCALE_ABOUT(0, 0, scalar)
+        return Transform.RESIZE(scalar, scalar)
 
     def set_scale(self, scalar):
         return self.set_resize(scalar, scalar)
@@ -159,8 +241,7 @@ class Transform(object):
     @staticmethod
     def ROTATE_ABOUT(xcenter, ycenter, angle):
         """Create a Rotation transform"""
-        return Transform.SKEW_ABOUT(xcenter, ycenter,
-                                    *helpers.rotation_matrix(angle).flatten())
+        return Transform.SKEW_ABOUT(xcenter, ycenter, *rotation(angle))
 
     def rotate_about(self, xcenter, ycenter, angle):
         return self.merge(Transform.ROTATE_ABOUT(xcenter, ycenter, angle))
@@ -168,10 +249,17 @@ class Transform(object):
     @staticmethod
     def ROTATE(angle):
         """Create a basic Rotation transformation"""
-        return Transform.ROTATE_ABOUT(0, 0, angle)
+        return Transform.SKEW(*rotation(angle))
 
     def set_rotate(self, angle):
-        return self.set_skew(*helpers.rotation_matrix(angle).flatten())
+        return self.set_skew(*rotation(angle))
 
     def rotate(self, angle):
         return self.merge(Transform.ROTATE(angle))
+
+
+def rotation(angle):
+    """Get the usual rotation matrix as (a, b, c, d)"""
+    angle = helpers.degtorad(angle)
+    cos, sin = math.cos(angle), math.sin(angle)
+    return cos, -sin, sin, cos
@@ -1,8 +1,10 @@
-import numpy
+import collections
 
-import aggdraw
+import numpy
 
 import programation.helpers as helpers
+import programation.paths as paths
+import programation.profiler as profiler
 import programation.shape as shape
 
 
@@ -23,19 +25,24 @@ class VShape(shape.Shape):
     def draw_self(self, canvas, pen, brush):
         if self.points.shape[0] == 0:
             return
-        path = "M {} {}".format(*self.points[0, 0:2])
-        # Convert to:
-        # [[H00, H10, A1], [H01, H11, A2], ..., [H0n-1, H1n-1, An]]
-        num_triplets = int((len(self.points) - 1) / 3)
-        triplets = self.points[1:].reshape(num_triplets, 3, self.dim)
-        for triplet in triplets:
-            # Take only the (x,y) coordinates from each point
-            path += " C {} {} {} {} {} {}".format(*triplet[:, 0:2].flatten())
-        if helpers.is_path_closed(self.points):
-            path += " Z"
-        symbol = aggdraw.Symbol(path)
+        with profiler.span("paths", self.__class__.__name__):
+            symbol = paths.make_symbol(paths.bezier_path(
+                self.points, helpers.is_path_closed(self.points)))
         canvas.drawing.symbol((0, 0), symbol, pen, brush)
 
+    def geometry_state(self):
+        return hash(self.points.tobytes())
+
+    def content_state(self):
+        return self.points.tobytes()
+
+    def local_box(self):
+        if self.points.shape[0] == 0:
+            return None
+        if self.points.shape[0] == 1:
+            return helpers.points_box(self.points[:, 0:2])
+        return helpers.bezier_box(self.get_curves()[..., 0:2])
+
     def create_points(self):
         # For sub classes
         return self
@@ -44,12 +51,7 @@ class VShape(shape.Shape):
         """Set points array to be:
         [A0, H00, H10, A1, H01, H11, ..., An]
         """
-        assert len(handles0) == len(handles1), "Handles must have same length"
-        assert len(anchors) == len(handles0) + 1, "# Points = # Handles + 1"
-        num_points = len(handles0) * 3
-        self.points = numpy.insert(numpy.stack([handles0, handles1,
-                                                anchors[1:]], axis=1)
-                                   .reshape(num_points, self.dim), 0, anchors[0], axis=0)
+        self.points = paths.join_points(anchors, handles0, handles1)
 
     def get_points(self):
         """Split back into (anchors, handles0, handles1)"""
@@ -76,19 +78,36 @@ class VShape(shape.Shape):
         return [v for v in self.flatten() if isinstance(v, VShape)
                 and v.points.any()]
 
+    def get_curves(self):
+        """Get the cubic curves as a (N, 4, dim) array of control points"""
+        return paths.split_curves(self.points)
+
     def subdivide(self, count=2):
         """Split each curve into n smaller curves"""
         if count <= 1:
             return self
-        icount = 1. / count
-        for obj in self.flatten_with_points():
-            newpoints = numpy.array([obj.points[0]])
-            for i in range(obj.count_anchors() - 1):
-                curve = obj.points[3 * i:3 * i + 4]
-                for j in range(count):
-                    newpoints = numpy.append(newpoints, helpers.split_bezier(
-                        curve, j * icount, (j + 1) * icount)[1:], axis=0)
-            obj.points = newpoints
+        objs = self.flatten_with_points()
+        if not objs:
+            return self
+        # Shapes can have different dims, their curves can't be stacked
+        groups = collections.defaultdict(list)
+        for obj in objs:
+            groups[obj.points.shape[1]].append(obj)
+        matrices = helpers.bezier_subdivision_matrices(count)[None]
+        for dim, group in groups.items():
+            curves = [obj.get_curves() for obj in group]
+            # Split every curve of the group at once
+            # (curve, part, point, dim)
+            parts = matrices @ numpy.concatenate(curves)[:, None]
+            start = 0
+            for obj, obj_curves in zip(group, curves):
+                end = start + len(obj_curves)
+                newpoints = numpy.empty((3 * count * len(obj_curves) + 1,
+                                         dim))
+                newpoints[0] = obj.points[0]
+                newpoints[1:] = parts[start:end, :, 1:].reshape(-1, dim)
+                obj.points = newpoints
+                start = end
         return self
 
     def transform_nonlinear(self, f, args, expanded=False, **kwargs):
@@ -124,3 +143,9 @@ class VShape(shape.Shape):
     def scale(self, s):
         self.points *= s
         return self
+
+    def apply_transform(self, transform_):
+        """Bake a Transform into the points of every shape in the tree"""
+        for obj in self.flatten_with_points():
+            transform_.apply_points(obj.points, in_place=True)
+        return self
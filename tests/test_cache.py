@@ -0,0 +1,41 @@
+import numpy
+
+import programation.cache as cache
+import programation.camera as camera
+import programation.shapes as shapes
+
+from test_camera import HEIGHT, WIDTH, WavyShape
+
+
+def test_frames_reused_across_cameras(tmp_path):
+    frames = []
+    for _ in range(2):
+        c = camera.Camera(width=WIDTH, height=HEIGHT,
+                          frame_cache=str(tmp_path))
+        for i in range(3):
+            c.capture_frame(shapes.Line((0, 0), (20 * i + 10, 50)))
+        frames.append(list(c.frames))
+    assert c.render_stats["cache_hits"] == 3
+    assert c.render_stats["rendered"] == 0
+    for a, b in zip(*frames):
+        assert numpy.array_equal(a, b)
+
+
+def test_unknown_shape_not_cached(tmp_path):
+    wavy = WavyShape()
+    wavy.resolve_transforms()
+    assert cache.frame_key([wavy], WIDTH, HEIGHT) is None
+    c = camera.Camera(width=WIDTH, height=HEIGHT, frame_cache=str(tmp_path))
+    c.capture_frame(wavy)
+    assert c.render_stats["cache_misses"] == 0
+    assert c.render_stats["rendered"] == 1
+
+
+def test_least_recently_used_evicted(tmp_path):
+    frame_cache = cache.FrameCache(str(tmp_path), 4, 4, max_size=3 * 64)
+    for i in range(4):
+        frame_cache.put(str(i), numpy.full((4, 4, 4), i, numpy.uint8))
+    assert frame_cache.get("0") is None
+    assert frame_cache.get("3")[0, 0, 0] == 3
+    assert sorted(cache.FrameCache(str(tmp_path), 4, 4).files) == \
+        ["1", "2", "3"]
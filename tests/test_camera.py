@@ -0,0 +1,172 @@
+import os
+
+import numpy
+
+import programation.camera as camera
+import programation.profiler as profiler
+import programation.shape as shape
+import programation.shapes as shapes
+
+WIDTH, HEIGHT = 100, 60
+
+
+class NewPolylineScene(object):
+    """Builds a new Polyline for every frame"""
+
+    def __call__(self, i):
+        return shapes.Polyline((0, 0), (50 + 10 * i, 40), (90, 10 * i)),
+
+
+class WavyShape(shape.Shape):
+    """Draws something different each time without a geometry_state"""
+
+    def __init__(self, **kwargs):
+        shape.Shape.__init__(self, **kwargs)
+        self.offset = 0
+
+    def draw_self(self, canvas, pen, brush):
+        canvas.drawing.line((self.offset, 0, 50, 50), pen)
+
+
+def distinct_frames(frames):
+    return len({numpy.asarray(frame).tobytes() for frame in frames})
+
+
+def test_new_shapes_each_frame():
+    for workers in (1, 2):
+        c = camera.Camera(width=WIDTH, height=HEIGHT)
+        c.capture_frames(NewPolylineScene(), 4, workers=workers)
+        assert distinct_frames(c.frames) == 4
+        assert c.render_stats["rendered"] == 4
+
+
+def test_serial_and_parallel_match():
+    cameras = []
+    for workers in (1, 2):
+        cameras.append(camera.Camera(width=WIDTH, height=HEIGHT))
+        cameras[-1].capture_frames(NewPolylineScene(), 4, workers=workers)
+    for a, b in zip(*(c.frames for c in cameras)):
+        assert numpy.array_equal(a, b)
+
+
+def test_unchanged_scene_is_reused():
+    c = camera.Camera(width=WIDTH, height=HEIGHT)
+    line = shapes.Line((0, 0), (50, 50))
+    c.capture_frame(line)
+    c.capture_frame(line)
+    assert c.frames[0] is c.frames[1]
+    assert c.render_stats["reused"] == 1
+
+
+def test_unknown_shape_always_redrawn():
+    c = camera.Camera(width=WIDTH, height=HEIGHT)
+    wavy = WavyShape()
+    c.capture_frame(wavy)
+    wavy.offset = 40
+    c.capture_frame(wavy)
+    assert distinct_frames(c.frames) == 2
+
+
+def test_new_static_shape_redraws_layer():
+    c = camera.Camera(width=WIDTH, height=HEIGHT, dedupe_frames=False)
+    for path in ("M 0 0 L 50 50", "M 0 50 L 50 0"):
+        c.capture_frame(shapes.Symbol(path, static=True))
+    assert distinct_frames(c.frames) == 2
+
+
+def test_deep_tree():
+    root = parent = shapes.Line((0, 0), (2, 1))
+    for _ in range(599):
+        child = shapes.Line((0, 0), (2, 1))
+        parent.add(child)
+        parent = child
+    c = camera.Camera(width=WIDTH, height=HEIGHT)
+    c.capture_frame(root)
+    c.capture_frame(root)
+    assert c.render_stats["reused"] == 1
+
+
+class HoldScene(object):
+    """Repeats each Line for two frames"""
+
+    def __call__(self, i):
+        return shapes.Line((0, 0), (10 * (i // 2) + 10, 50)),
+
+
+def test_worker_stats_match_serial(tmp_path):
+    stats = []
+    for workers in (1, 2):
+        c = camera.Camera(width=WIDTH, height=HEIGHT,
+                          frame_cache=str(tmp_path / str(workers)))
+        c.capture_frames(HoldScene(), 6, workers=workers)
+        stats.append(c.render_stats)
+    assert stats[0]["rendered"] == 3
+    assert stats[0]["reused"] == 3
+    assert stats[0]["cache_hits"] == 0
+    for stats_ in stats:
+        assert stats_["rendered"] + stats_["reused"] + \
+            stats_["cache_hits"] == 6
+        # Every drawn frame was looked up in the cache first
+        assert stats_["cache_misses"] == stats_["rendered"]
+
+
+class StillScene(object):
+    """The same Line in every frame"""
+
+    def __call__(self, i):
+        return shapes.Line((0, 0), (50, 50)),
+
+
+def test_worker_stats_add_up():
+    c = camera.Camera(width=WIDTH, height=HEIGHT)
+    c.capture_frames(StillScene(), 8, workers=4)
+    stats = c.render_stats
+    assert stats["rendered"] + stats["reused"] == 8
+    assert 1 <= stats["rendered"] <= 4
+    # The frame is stored once
+    assert all(frame is c.frames[0] for frame in c.frames)
+    assert stats["bytes_saved"] == 7 * c.frames[0].nbytes
+
+
+def test_workers_not_profiled():
+    profile = profiler.start()
+    try:
+        c = camera.Camera(width=WIDTH, height=HEIGHT)
+        c.capture_frames(NewPolylineScene(), 4, workers=2)
+    finally:
+        profiler.stop()
+    # Shapes are only drawn in the workers
+    assert {category for category, _ in profile.stats} == {"camera"}
+    assert profile.stats[("camera", "wait")][0] == 4
+
+
+def test_init_worker_stops_profiler():
+    # As if the main module started profiling when a worker imported it
+    profiler.start()
+    try:
+        camera.init_worker(NewPolylineScene(), dict(width=WIDTH,
+                                                    height=HEIGHT))
+        assert profiler.ACTIVE is None
+    finally:
+        profiler.stop()
+
+
+def test_temporary_store_deleted():
+    c = camera.Camera(width=WIDTH, height=HEIGHT, frame_store="memmap")
+    c.capture_frames(NewPolylineScene(), 3)
+    path = c.frames.path
+    frame = c.frames[2]
+    assert os.path.exists(path)
+    c.close()
+    for suffix in ("", ".json", ".index"):
+        assert not os.path.exists(path + suffix)
+    assert frame.any()
+
+
+def test_named_store_kept(tmp_path):
+    path = str(tmp_path / "frames")
+    c = camera.Camera(width=WIDTH, height=HEIGHT, frame_store="memmap",
+                      frame_store_path=path)
+    c.capture_frames(NewPolylineScene(), 3)
+    c.close()
+    assert len(camera.Camera.from_store(path).frames) == 3
@@ -0,0 +1,32 @@
+import programation.helpers as helpers
+import programation.shape as shape
+import programation.shapes as shapes
+
+
+def test_config_edited_in_place():
+    shapes.Line((0, 0), (1, 1))
+    config = shape.Shape.CONFIG
+    old_width = config["stroke_width"]
+    try:
+        config["stroke_width"] = 5.
+        assert shapes.Line((0, 0), (1, 1)).stroke_width == 5.
+        config["extra"] = "added"
+        assert shapes.Line((0, 0), (1, 1)).extra == "added"
+    finally:
+        config["stroke_width"] = old_width
+        config.pop("extra", None)
+    line = shapes.Line((0, 0), (1, 1))
+    assert line.stroke_width == old_width
+    assert not hasattr(line, "extra")
+
+
+def test_config_replaced():
+    shapes.BezierCurve((0, 0), (1, 1), (2, 0), (3, 1))
+    old_config = shapes.BezierCurve.CONFIG
+    try:
+        shapes.BezierCurve.CONFIG = dict(old_config, slice_pos=.5)
+        assert shapes.BezierCurve((0, 0), (1, 1), (2, 0),
+                                  (3, 1)).slice_pos == .5
+    finally:
+        shapes.BezierCurve.CONFIG = old_config
+    assert helpers.get_config(shapes.BezierCurve)[0]["slice_pos"] == 1.
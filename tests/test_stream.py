@@ -0,0 +1,92 @@
+import os
+import shutil
+import subprocess
+
+import numpy
+import pytest
+
+import programation.camera as camera
+import programation.helpers as helpers
+import programation.stream as stream
+
+pytestmark = pytest.mark.skipif(shutil.which(helpers.FFMPEG_BIN) is None,
+                                reason="FFmpeg not found")
+
+WIDTH, HEIGHT = 64, 48
+COUNT = 8
+
+
+def make_frames(count=COUNT):
+    """Solid frames, getting redder and less blue"""
+    frames = []
+    for i in range(count):
+        frame = numpy.zeros((HEIGHT, WIDTH, 4), dtype=numpy.uint8)
+        frame[..., 0] = 30 * i
+        frame[..., 2] = 255 - 30 * i
+        frame[..., 3] = 255
+        frames.append(frame)
+    return frames
+
+
+def decode(filename):
+    """Get the (N, height, width, 3) frames of a video"""
+    result = subprocess.run([
+        helpers.FFMPEG_BIN, "-v", "error", "-i", filename,
+        "-vsync", "passthrough", "-f", "rawvideo", "-pix_fmt", "rgb24", "-"
+    ], stdout=subprocess.PIPE, check=True)
+    return numpy.frombuffer(result.stdout, dtype=numpy.uint8)\
+        .reshape(-1, HEIGHT, WIDTH, 3)
+
+
+def assert_same_frames(filename, frames, tolerance=12):
+    decoded = decode(filename)
+    assert len(decoded) == len(frames)
+    for expected, actual in zip(frames, decoded):
+        difference = numpy.abs(actual.mean(axis=(0, 1)) -
+                               expected[..., :3].mean(axis=(0, 1)))
+        assert (difference < tolerance).all()
+
+
+def capture(frames):
+    c = camera.Camera(width=WIDTH, height=HEIGHT, loop_behavior="reverse")
+    for frame in frames:
+        c.add_frame(frame)
+    return c
+
+
+def test_mp4_segments(tmp_path):
+    filename = str(tmp_path / "segments.mp4")
+    frames = make_frames()
+    stream.write_segments(frames, filename, WIDTH, HEIGHT, 3,
+                          quality="draft")
+    assert_same_frames(filename, frames)
+    # The segments' working directory is removed
+    assert os.listdir(str(tmp_path)) == ["segments.mp4"]
+
+
+def test_reversed_segments(tmp_path):
+    filename = str(tmp_path / "reversed.mp4")
+    frames = make_frames()
+    capture(frames).write_to_file(filename, show_loop=True, quality="draft",
+                                  segments=3)
+    assert_same_frames(filename, frames + frames[::-1])
+
+
+def test_gif_not_segmented(tmp_path):
+    filename = str(tmp_path / "loop.gif")
+    frames = make_frames()
+    assert not stream.can_segment(filename, COUNT, 3)
+    capture(frames).write_to_file(filename, quality="draft", segments=3)
+    assert_same_frames(filename, frames, tolerance=40)
+
+
+def test_failed_concat_falls_back(tmp_path, monkeypatch):
+    def fail(paths, filename):
+        raise IOError("FFmpeg failed: concat")
+    monkeypatch.setattr(stream, "concat_videos", fail)
+    filename = str(tmp_path / "fallback.mp4")
+    frames = make_frames()
+    capture(frames).write_to_file(filename, show_loop=True, quality="draft",
+                                  segments=3)
+    assert_same_frames(filename, frames + frames[::-1])
+    assert os.listdir(str(tmp_path)) == ["fallback.mp4"]
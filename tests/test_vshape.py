@@ -0,0 +1,29 @@
+import numpy
+
+import programation.helpers as helpers
+import programation.paths as paths
+import programation.vshape as vshape
+import programation.vshapes as vshapes
+
+
+def split_each(points, count):
+    """Subdivide a shape's points one curve at a time"""
+    result = [points[:1]]
+    for curve in paths.split_curves(points):
+        for i in range(count):
+            result.append(helpers.split_bezier(curve, i / count,
+                                               (i + 1) / count)[1:])
+    return numpy.concatenate(result)
+
+
+def test_subdivide_mixed_dims():
+    rect = vshapes.Rectangle(width=4., height=2.)
+    child = vshape.VShape(dim=3)
+    child.points = numpy.arange(21, dtype=float).reshape(7, 3) + 1.
+    rect.add(child)
+    expected = [split_each(shape.points, 3) for shape in (rect, child)]
+    rect.subdivide(3)
+    assert child.points.shape == (19, 3)
+    for shape, points in zip((rect, child), expected):
+        assert shape.points.shape == points.shape
+        assert numpy.allclose(shape.points, points)